@@ -4,7 +4,6 @@
 #  -->KNN-->MajorityFilter-->... repeat this process
 from __future__ import print_function
 import numpy as np
-from Toolbox.rolling_window import rolling_window as rw
 import spectral as spy
 
 
@@ -12,23 +11,67 @@ class Processor:
     def __init__(self):
         pass
 
-    def prepare_data(self, img_path, gt_path):
-        if img_path[-3:] == 'mat':
-            import scipy.io as sio
-            img_mat = sio.loadmat(img_path)
-            gt_mat = sio.loadmat(gt_path)
-            img_keys = img_mat.keys()
-            gt_keys = gt_mat.keys()
-            img_key = [k for k in img_keys if k != '__version__' and k != '__header__' and k != '__globals__']
-            gt_key = [k for k in gt_keys if k != '__version__' and k != '__header__' and k != '__globals__']
-            return img_mat.get(img_key[0]).astype('float64'), gt_mat.get(gt_key[0]).astype('int8')
+    def prepare_data(self, img_path, gt_path, dtype='float64', lazy=False, band_index=None):
+        """
+        :param img_path: .mat (any version), .npy or ENVI image (header or data file)
+        :param gt_path:
+        :param dtype: dtype of the image, None keeps the stored dtype
+        :param lazy: if True, .npy, v7.3 .mat and ENVI images are returned as a memory-mapped LazyCube
+                that is only read when sliced
+        :param band_index: if given, only these bands of the image are read and returned
+        :return: image, ground truth
+        """
+        if img_path[-3:] == 'mat' or img_path[-3:] == 'npy':
+            img = self.__load_array(img_path, dtype=dtype, lazy=lazy, band_index=band_index)
+            gt = self.__load_array(gt_path, dtype='int8', lazy=False)
+            return img, gt
         else:
-            import spectral as spy
-            img = spy.open_image(img_path).load()
-            gt = spy.open_image(gt_path)
-            a = spy.principal_components()
-            a.transform()
-            return img, gt.read_band(0)
+            from Toolbox.envi import open_envi
+            img = open_envi(img_path, dtype=dtype)
+            gt = open_envi(gt_path)[:, :, 0]
+            if band_index is not None:
+                return img.read_bands(band_index), gt
+            return (img if lazy else img[...]), gt
+
+    def load_normalized(self, img_path, gt_path, cache_dir=None, dtype='float64', feature_range=(0, 1)):
+        """
+        min-max scaled cube as in minmax_scale(img.reshape(n_row * n_column, n_band)), cached on disk and keyed
+        by the content of the source files and the preprocessing parameters
+        :param img_path:
+        :param gt_path:
+        :param cache_dir: see Toolbox.cube_cache.CubeCache
+        :param dtype:
+        :param feature_range:
+        :return: cube as a read-only memmap (n_row, n_column, n_band), gt, index of the labeled pixels
+                in the flattened image (img_correct = cube.reshape(-1, n_band)[index])
+        """
+        from Toolbox.cube_cache import CubeCache
+        return CubeCache(cache_dir).load(img_path, gt_path, self, dtype=dtype, feature_range=feature_range)
+
+    def __load_array(self, path, dtype=None, lazy=False, band_index=None):
+        """
+        load the first array of a .mat file (v7.3 through h5py) or a .npy file
+        :param path:
+        :param dtype: None keeps the stored dtype
+        :param lazy: return a memory-mapped LazyCube instead of an np.ndarray when the format allows it
+        :param band_index: bands to read from a cube
+        :return:
+        """
+        from Toolbox.lazy_cube import open_cube, is_hdf5
+        if path[-3:] == 'npy' or is_hdf5(path):
+            cube = open_cube(path, dtype=dtype)
+            if band_index is None and lazy:
+                return cube
+            arr = cube[...] if band_index is None else cube.read_bands(band_index)
+            cube.close()
+            return arr
+        import scipy.io as sio
+        mat = sio.loadmat(path)
+        key = [k for k in mat.keys() if k != '__version__' and k != '__header__' and k != '__globals__']
+        arr = mat.get(key[0])
+        if band_index is not None:
+            arr = arr[:, :, list(band_index)]
+        return arr if dtype is None else arr.astype(dtype)
 
     def get_correct(self, img, gt):
         """
@@ -57,19 +100,21 @@ class Processor:
         :param block_size; tuple of size, it must be odd and >=3
         :return: correct image blocks
         """
-        # TODO: padding edge with mirror
-        w_1, w_2 = int((block_size[0] - 1) / 2), int((block_size[1] - 1) / 2)
-        img_padding = np.pad(img, ((w_1, w_2),
-                                   (w_1, w_2), (0, 0)), 'symmetric')
-        gt_padding = np.pad(gt, ((w_1, w_2),
-                                 (w_1, w_2)), 'symmetric')
-        img_blocks = rw(img_padding, block_size, axes=(1, 0))  # divide data into 5x5 blocks
-        gt_blocks = rw(gt_padding, block_size, axes=(1, 0))
-        i_1, i_2 = int((block_size[0] - 1) / 2), int((block_size[0] - 1) / 2)
-        nonzero_index = gt_blocks[:, :, i_1, i_2].nonzero()
-        img_blocks_nonzero = img_blocks[nonzero_index]
-        gt_blocks_nonzero = (gt_blocks[:, :, i_1, i_2])[nonzero_index]
-        return img_blocks_nonzero, gt_blocks_nonzero
+        # all blocks at once, use patch_source to gather them batch by batch
+        source = self.patch_source(img, gt, block_size=block_size)
+        return source[:], source.labels
+
+    def patch_source(self, img, gt, block_size=(5, 5)):
+        """
+        lazy version of divide_img_blocks: the padded image is kept once and blocks are copied only when
+        a batch is requested, e.g. for patches, labels in source.iter_batches(1024)
+        :param img:
+        :param gt:
+        :param block_size: tuple of size, it must be odd and >=3
+        :return: Toolbox.patches.PatchSource
+        """
+        from Toolbox.patches import PatchSource
+        return PatchSource(img, gt, block_size=block_size)
 
     def split_tr_tx(self, X, y, test_size=0.4):
         """
@@ -212,53 +257,93 @@ class Processor:
         gt_1D[test_indexes] = y_predicted
         return gt_1D.reshape(n_row, n_col)
 
-    def extended_morphological_profile(self, components, disk_radius):
+    def classify_scene(self, img, classifier, band_index=None, scaler=None, tile_rows=64, batch_size=None,
+                       out=None, dtype='int16'):
+        """
+        classification map of the whole scene, read and classified tile by tile so that memory does not depend on
+        the scene size
+        :param img: 3D arr (n_row, n_column, n_band), np.memmap or LazyCube
+        :param classifier: fitted classifier with predict(X)
+        :param band_index: selected bands, read from each tile; None for all bands
+        :param scaler: fitted transformer with transform(X), e.g. sklearn's MinMaxScaler, applied before predict
+        :param tile_rows: image rows read at once
+        :param batch_size: pixels passed to predict at once, default one tile
+        :param out: None, a preallocated 2D arr, or the path of a .npy file created as a memmap
+        :param dtype: dtype of the map when out is None or a path
+        :return: label map (n_row, n_column)
+        """
+        n_row, n_column = img.shape[0], img.shape[1]
+        if out is None:
+            out = np.empty((n_row, n_column), dtype=dtype)
+        elif isinstance(out, str):
+            out = np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=(n_row, n_column))
+        bands = slice(None) if band_index is None else list(band_index)
+        for start in range(0, n_row, tile_rows):
+            tile = np.asarray(img[start:start + tile_rows, :, bands])
+            pixels = tile.reshape(tile.shape[0] * n_column, -1)
+            if scaler is not None:
+                pixels = scaler.transform(pixels)
+            step = pixels.shape[0] if batch_size is None else batch_size
+            labels = np.concatenate([classifier.predict(pixels[i:i + step]) for i in range(0, pixels.shape[0], step)])
+            out[start:start + tile.shape[0]] = labels.reshape(tile.shape[0], n_column)
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
+
+    def extended_morphological_profile(self, components, disk_radius, n_jobs=1, dtype='float32'):
         """
 
         :param components:
         :param disk_radius:
+        :param n_jobs: number of threads, each one builds the profile of one component at a time
+        :param dtype: dtype of the emp, min / max filters are exact in any float type
         :return:2-dim emp
         """
+        from Toolbox.morphology import disk_chain, opening_closing_profile
         rows, cols, bands = components.shape
         n = disk_radius.__len__()
-        import numpy as np
-        emp = np.zeros((rows * cols, bands * (2 * n + 1)))
-        from skimage.morphology import opening, closing, disk
-        for band in range(bands):
+        emp = np.zeros((rows, cols, bands * (2 * n + 1)), dtype=dtype)
+        chain = disk_chain(disk_radius)
+
+        def profile(band):
             position = band * (n * 2 + 1) + n
-            emp_ = np.zeros((rows, cols, 2 * n + 1))
-            emp_[:, :, n] = components[:, :, band]
-            i = 1
-            for r in disk_radius:
-                closed = closing(components[:, :, band], selem=disk(r))
-                opened = opening(components[:, :, band], selem=disk(r))
-                emp_[:, :, n - i] = closed
-                emp_[:, :, n + i] = opened
-                i += 1
-            emp[:, position - n:position + n + 1] = emp_.reshape((rows * cols, 2 * n + 1))
-        return emp.reshape(rows, cols, bands * (2 * n + 1))
-
-    def texture_feature(self, components, theta_arr=None, frequency_arr=None):
+            component = np.asarray(components[:, :, band], dtype=dtype)
+            closed, opened = opening_closing_profile(component, disk_radius, chain)
+            emp[:, :, position] = component
+            for i in range(1, n + 1):
+                emp[:, :, position - i] = closed[i - 1]
+                emp[:, :, position + i] = opened[i - 1]
+
+        if n_jobs == 1:
+            for band in range(bands):
+                profile(band)
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+                list(pool.map(profile, range(bands)))
+        return emp
+
+    def texture_feature(self, components, theta_arr=None, frequency_arr=None, tile_rows=None, out=None,
+                        dtype='float64'):
         """
         extract the texture features
         :param components:
         :param theta_arr:
         :param frequency_arr:
+        :param tile_rows: image rows filtered at once, None for the whole image
+        :param out: preallocated output (n_row, n_column, n_component * n_theta * n_frequency)
+        :param dtype: dtype of the output when out is None
         :return:
         """
-        if theta_arr == None:
+        if theta_arr is None:
             theta_arr = np.arange(0, 8) * np.pi / 4  # 8 orientations
-        if frequency_arr == None:
+        if frequency_arr is None:
             frequency_arr = np.pi / (2 ** np.arange(1, 5))  # 4 frequency
 
-        from skimage.filters import gabor
-        results = []
-        for img in components.transpose():
-            for theta in theta_arr:
-                for fre in frequency_arr:
-                    filt_real, filt_imag = gabor(img, frequency=fre, theta=theta)
-                    results.append(filt_real)
-        return np.array(results).transpose()
+        from Toolbox.gabor import gabor_bank, gabor_responses
+        # the components used to be filtered transposed, i.e. with the transposed kernels
+        bank = gabor_bank(theta_arr, frequency_arr).transpose(0, 2, 1)
+        return gabor_responses(components, bank, tile_rows=tile_rows, out=out, dtype=dtype)
 
     def pca_transform(self, n_components, samples):
         """
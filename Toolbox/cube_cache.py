@@ -0,0 +1,134 @@
+"""
+Description:
+    on-disk cache of preprocessed cubes; the min-max scaled cube, the ground truth and the index of the labeled
+    pixels are stored as .npy files that later runs open as memory maps instead of decoding and scaling again
+"""
+import hashlib
+import json
+import os
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def file_digest(path, block_size=2 ** 20):
+    """
+    sha1 of the content of a file, read block by block
+    :param path:
+    :param block_size:
+    :return: hex digest string
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CubeCache(object):
+
+    def __init__(self, cache_dir=None):
+        """
+        :param cache_dir: default ./cache in the working directory
+        """
+        if cache_dir is None:
+            cache_dir = os.getcwd() + '/cache'
+        self.cache_dir = cache_dir
+
+    def digest(self, path):
+        """
+        content hash of a source file; the hash is remembered with the file size and modification time,
+        so unchanged files are not read again
+        :param path:
+        :return: hex digest string
+        """
+        index_path = os.path.join(self.cache_dir, 'digests.json')
+        index = {}
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = index.get(path)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha1']
+        sha1 = file_digest(path)
+        index[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': sha1}
+        self.__write_json(index_path, index)
+        return sha1
+
+    def key(self, img_path, gt_path, **params):
+        """
+        :param img_path:
+        :param gt_path:
+        :param params: preprocessing parameters
+        :return: cache key of the sources and the parameters
+        """
+        description = json.dumps({'img': self.digest(img_path), 'gt': self.digest(gt_path),
+                                  'params': params, 'version': CACHE_VERSION}, sort_keys=True)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def load(self, img_path, gt_path, processor, dtype='float64', feature_range=(0, 1), chunk_rows=64):
+        """
+        min-max scaled cube (each band scaled over all pixels, as sklearn's minmax_scale), ground truth and
+        index of the labeled pixels in the flattened image, built on the first call
+        :param img_path:
+        :param gt_path:
+        :param processor: Processor used to read the sources
+        :param dtype: dtype of the cached cube
+        :param feature_range:
+        :param chunk_rows: image rows scaled at once when the cache is built
+        :return: cube as a read-only memmap of shape (n_row, n_column, n_band), gt, labeled index
+        """
+        feature_range = tuple(float(v) for v in feature_range)
+        key = self.key(img_path, gt_path, dtype=np.dtype(dtype).str, feature_range=feature_range)
+        folder = os.path.join(self.cache_dir, key)
+        if not os.path.exists(os.path.join(folder, 'meta.json')):
+            self.__build(folder, img_path, gt_path, processor, dtype, feature_range, chunk_rows)
+        cube = np.load(os.path.join(folder, 'cube.npy'), mmap_mode='r')
+        gt = np.load(os.path.join(folder, 'gt.npy'))
+        index = np.load(os.path.join(folder, 'index.npy'))
+        return cube, gt, index
+
+    def __build(self, folder, img_path, gt_path, processor, dtype, feature_range, chunk_rows):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        img, gt = processor.prepare_data(img_path, gt_path, dtype=None, lazy=True)
+        n_row, n_column, n_band = img.shape
+        # band minimum and maximum in a first pass over row tiles
+        data_min, data_max = np.full(n_band, np.inf), np.full(n_band, -np.inf)
+        for start in range(0, n_row, chunk_rows):
+            tile = np.asarray(img[start:start + chunk_rows], dtype=np.float64).reshape(-1, n_band)
+            data_min = np.minimum(data_min, tile.min(axis=0))
+            data_max = np.maximum(data_max, tile.max(axis=0))
+        data_range = data_max - data_min
+        data_range[data_range == 0.] = 1.
+        scale = (feature_range[1] - feature_range[0]) / data_range
+        offset = feature_range[0] - data_min * scale
+        # scaled cube written in a second pass, the file is renamed once complete
+        cube_path = os.path.join(folder, 'cube.npy')
+        cube = np.lib.format.open_memmap(cube_path + '.tmp.npy', mode='w+', dtype=dtype,
+                                         shape=(n_row, n_column, n_band))
+        for start in range(0, n_row, chunk_rows):
+            tile = np.asarray(img[start:start + chunk_rows], dtype=np.float64)
+            cube[start:start + tile.shape[0]] = tile * scale + offset
+        cube.flush()
+        del cube
+        if hasattr(img, 'close'):
+            img.close()
+        os.replace(cube_path + '.tmp.npy', cube_path)
+        np.save(os.path.join(folder, 'gt.npy'), gt)
+        np.save(os.path.join(folder, 'index.npy'), gt.reshape(-1).nonzero()[0])
+        self.__write_json(os.path.join(folder, 'meta.json'),
+                          {'img_path': os.path.abspath(img_path), 'gt_path': os.path.abspath(gt_path),
+                           'shape': [n_row, n_column, n_band], 'dtype': np.dtype(dtype).str,
+                           'feature_range': list(feature_range), 'data_min': data_min.tolist(),
+                           'data_max': data_max.tolist()})
+
+    def __write_json(self, path, content):
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(content, f)
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,87 @@
+"""
+Description:
+    reader of ENVI raw cubes (.hdr + binary file) that memory-maps the data file according to its interleave,
+    so that a band subset is read without loading the other bands
+"""
+import os
+import numpy as np
+from Toolbox.lazy_cube import LazyCube
+
+# ENVI 'data type' codes
+ENVI_DTYPES = {1: 'u1', 2: 'i2', 3: 'i4', 4: 'f4', 5: 'f8', 6: 'c8', 9: 'c16',
+               12: 'u2', 13: 'u4', 14: 'i8', 15: 'u8'}
+DATA_EXTENSIONS = ('', '.img', '.dat', '.raw', '.bsq', '.bil', '.bip')
+
+
+def read_envi_header(hdr_path):
+    """
+    :param hdr_path:
+    :return: dict of the header fields, keys in lower case, {...} values as lists of strings
+    """
+    with open(hdr_path) as f:
+        lines = f.read().splitlines()
+    if not lines or lines[0].strip() != 'ENVI':
+        raise ValueError('%s is not an ENVI header' % hdr_path)
+    header = {}
+    i = 1
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        key, value = key.strip().lower(), value.strip()
+        if value.startswith('{'):
+            # values in braces may span several lines
+            while '}' not in value and i < len(lines):
+                value += ' ' + lines[i].strip()
+                i += 1
+            value = [v.strip() for v in value.strip('{} ').split(',')]
+        header[key] = value
+    return header
+
+
+def find_envi_files(path):
+    """
+    :param path: header file or data file
+    :return: header path, data path
+    """
+    base = path[:-4] if path.lower().endswith('.hdr') else path
+    hdr_path = base + '.hdr' if os.path.exists(base + '.hdr') else os.path.splitext(base)[0] + '.hdr'
+    if not os.path.exists(hdr_path):
+        raise IOError('no ENVI header found for %s' % path)
+    if path.lower().endswith('.hdr'):
+        for extension in DATA_EXTENSIONS:
+            if os.path.isfile(base + extension):
+                return hdr_path, base + extension
+        raise IOError('no ENVI data file found for %s' % path)
+    return hdr_path, path
+
+
+def open_envi(path, dtype=None):
+    """
+    open an ENVI cube lazily; slicing and LazyCube.read_bands only read the requested bands.
+    For BSQ files each band is one contiguous block of the file, for BIL files one contiguous run per image row,
+    for BIP files the bands of a pixel are adjacent and a band subset still touches most pages of the file.
+    :param path: header file or data file
+    :param dtype: dtype of the returned slices, None keeps the stored dtype
+    :return: LazyCube of shape (lines, samples, bands)
+    """
+    hdr_path, data_path = find_envi_files(path)
+    header = read_envi_header(hdr_path)
+    n_row, n_column, n_band = int(header['lines']), int(header['samples']), int(header['bands'])
+    stored = np.dtype(ENVI_DTYPES[int(header['data type'])])
+    stored = stored.newbyteorder('>' if int(header.get('byte order', 0)) == 1 else '<')
+    interleave = header.get('interleave', 'bsq').lower()
+    offset = int(header.get('header offset', 0))
+    if interleave == 'bsq':
+        data = np.memmap(data_path, dtype=stored, mode='r', offset=offset, shape=(n_band, n_row, n_column))
+        data = data.transpose(1, 2, 0)
+    elif interleave == 'bil':
+        data = np.memmap(data_path, dtype=stored, mode='r', offset=offset, shape=(n_row, n_band, n_column))
+        data = data.transpose(0, 2, 1)
+    elif interleave == 'bip':
+        data = np.memmap(data_path, dtype=stored, mode='r', offset=offset, shape=(n_row, n_column, n_band))
+    else:
+        raise ValueError('unknown interleave %s' % interleave)
+    return LazyCube(data, dtype=stored.newbyteorder('=') if dtype is None else dtype)
@@ -0,0 +1,61 @@
+"""
+Description:
+    Gabor filter bank applied in the frequency domain; all kernels are built and transformed once and every
+    component is convolved with the whole bank by one batched FFT, optionally tile by tile
+"""
+import numpy as np
+from scipy import fft
+
+
+def gabor_bank(theta_arr, frequency_arr):
+    """
+    real parts of skimage.filters.gabor_kernel(frequency, theta), zero-padded to a common size
+    :param theta_arr:
+    :param frequency_arr:
+    :return: kernels of shape (n_theta * n_frequency, 2 * a + 1, 2 * b + 1), theta-major
+    """
+    from skimage.filters import gabor_kernel
+    kernels = [np.real(gabor_kernel(fre, theta=theta)) for theta in theta_arr for fre in frequency_arr]
+    a = max(k.shape[0] for k in kernels) // 2
+    b = max(k.shape[1] for k in kernels) // 2
+    bank = np.zeros((len(kernels), 2 * a + 1, 2 * b + 1))
+    for i, k in enumerate(kernels):
+        h, w = k.shape[0] // 2, k.shape[1] // 2
+        bank[i, a - h:a + h + 1, b - w:b + w + 1] = k
+    return bank
+
+
+def gabor_responses(components, bank, tile_rows=None, out=None, dtype='float64', workers=None):
+    """
+    real Gabor responses of every component, identical to scipy.ndimage.convolve(img, kernel, mode='reflect')
+    (as used by skimage.filters.gabor) up to FFT round-off
+    :param components: 3D arr (n_row, n_column, n_component)
+    :param bank: kernels of shape (n_kernel, 2 * a + 1, 2 * b + 1), see gabor_bank
+    :param tile_rows: rows convolved at once, None for the whole image
+    :param out: preallocated output of shape (n_row, n_column, n_component * n_kernel), e.g. a np.memmap
+    :param dtype: dtype of the output when out is None
+    :param workers: threads of scipy.fft
+    :return: responses, component-major then kernel order
+    """
+    n_row, n_column, n_component = components.shape
+    n_kernel, a, b = bank.shape[0], bank.shape[1] // 2, bank.shape[2] // 2
+    if out is None:
+        out = np.empty((n_row, n_column, n_component * n_kernel), dtype=dtype)
+    if tile_rows is None:
+        tile_rows = n_row
+    spectra = {}
+    for c in range(n_component):
+        # mirror padding as mode='reflect' of scipy.ndimage
+        padded = np.pad(np.asarray(components[:, :, c], dtype=np.float64), ((a, a), (b, b)), 'symmetric')
+        for start in range(0, n_row, tile_rows):
+            stop = min(start + tile_rows, n_row)
+            # rows start - a ... stop + a of the image are enough for the convolution of the tile
+            block = padded[start:stop + 2 * a]
+            shape = (fft.next_fast_len(block.shape[0], real=True), fft.next_fast_len(block.shape[1], real=True))
+            if shape not in spectra:
+                spectra[shape] = fft.rfft2(bank, s=shape, workers=workers)
+            response = fft.irfft2(fft.rfft2(block, s=shape, workers=workers) * spectra[shape], s=shape,
+                                  workers=workers)
+            response = response[:, 2 * a:2 * a + stop - start, 2 * b:2 * b + n_column]
+            out[start:stop, :, c * n_kernel:(c + 1) * n_kernel] = response.transpose(1, 2, 0)
+    return out
@@ -0,0 +1,111 @@
+"""
+Description:
+    sparse kNN affinity graph over pixels, built with a space-partitioning tree and queried in chunks,
+    as a replacement of the dense pairwise distances in skfeature.utility.construct_W
+"""
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csc_matrix
+from sklearn.neighbors import NearestNeighbors
+from Toolbox.streaming import array_digest
+
+_GRAPH_CACHE = OrderedDict()
+_GRAPH_CACHE_SIZE = 4
+
+
+class KNNGraph(object):
+    """
+    k nearest neighbours (the pixel itself included, as in construct_W) of every pixel
+    """
+    def __init__(self, k=5, n_components=None, algorithm='auto', chunk_size=4096, random_state=None):
+        """
+        :param k: neighbour size
+        :param n_components: if given, the tree is built on a Gaussian random projection to this many dimensions
+                and the candidates are re-ranked by their exact distance (approximate search)
+        :param algorithm: 'auto', 'ball_tree' or 'kd_tree', see sklearn.neighbors.NearestNeighbors
+        :param chunk_size: number of pixels queried at once
+        :param random_state: seed of the random projection
+        """
+        self.k = k
+        self.n_components = n_components
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+        self.random_state = random_state
+
+    def fit(self, X):
+        """
+        :param X: shape [n_pixel, n_band]
+        :return: self, with indices_ and squared distances distances_ of shape [n_pixel, k + 1]
+        """
+        n_pixel = X.shape[0]
+        n_neighbors = min(self.k + 1, n_pixel)
+        projected = self.n_components is not None and self.n_components < X.shape[1]
+        if projected:
+            rng = np.random.RandomState(self.random_state)
+            projection = rng.normal(size=(X.shape[1], self.n_components)) / np.sqrt(self.n_components)
+            data = np.dot(X, projection)
+            n_candidates = min(4 * n_neighbors, n_pixel)
+        else:
+            data = X
+            n_candidates = n_neighbors
+        nn = NearestNeighbors(n_neighbors=n_candidates, algorithm=self.algorithm).fit(data)
+        self.indices_ = np.empty((n_pixel, n_neighbors), dtype=np.int64)
+        self.distances_ = np.empty((n_pixel, n_neighbors))
+        for start in range(0, n_pixel, self.chunk_size):
+            stop = min(start + self.chunk_size, n_pixel)
+            distance, index = nn.kneighbors(data[start:stop])
+            if projected:
+                # exact squared distances of the candidates, keep the nearest ones
+                distance = np.sum((np.asarray(X[start:stop])[:, np.newaxis, :] - X[index]) ** 2, axis=2)
+                order = np.argsort(distance, axis=1)[:, :n_neighbors]
+                index = np.take_along_axis(index, order, axis=1)
+                distance = np.take_along_axis(distance, order, axis=1)
+            else:
+                distance **= 2
+            self.indices_[start:stop] = index
+            self.distances_[start:stop] = distance
+        return self
+
+    def affinity(self, weight_mode='heat_kernel', t=1):
+        """
+        symmetric sparse affinity, same weights as construct_W(neighbor_mode='knn', metric='euclidean')
+        :param weight_mode: 'heat_kernel' (exp(-d^2 / (2t^2))) or 'binary'
+        :param t: heat kernel parameter
+        :return: csc_matrix of shape [n_pixel, n_pixel]
+        """
+        n_pixel = self.indices_.shape[0]
+        if weight_mode == 'heat_kernel':
+            weight = np.exp(-self.distances_ / (2 * t * t))
+        elif weight_mode == 'binary':
+            weight = np.ones(self.distances_.shape)
+        else:
+            raise ValueError('weight_mode must be heat_kernel or binary')
+        row = np.repeat(np.arange(n_pixel), self.indices_.shape[1])
+        W = csc_matrix((weight.ravel(), (row, self.indices_.ravel())), shape=(n_pixel, n_pixel))
+        bigger = np.transpose(W) > W
+        W = W - W.multiply(bigger) + np.transpose(W).multiply(bigger)
+        return W
+
+
+def knn_graph(X, k=5, weight_mode='heat_kernel', t=1, n_components=None, cache=True):
+    """
+    sparse kNN affinity of the pixels of X; the neighbour search is cached by content hash,
+    so that e.g. Laplacian score and NDFS on the same cube share one graph
+    :param X: shape [n_pixel, n_band]
+    :param k:
+    :param weight_mode: 'heat_kernel' or 'binary'
+    :param t:
+    :param n_components: see KNNGraph
+    :param cache:
+    :return: csc_matrix of shape [n_pixel, n_pixel]
+    """
+    if not cache:
+        return KNNGraph(k, n_components=n_components).fit(X).affinity(weight_mode, t)
+    key = (array_digest(X), k, n_components)
+    if key in _GRAPH_CACHE:
+        _GRAPH_CACHE.move_to_end(key)
+    else:
+        _GRAPH_CACHE[key] = KNNGraph(k, n_components=n_components).fit(X)
+        while len(_GRAPH_CACHE) > _GRAPH_CACHE_SIZE:
+            _GRAPH_CACHE.popitem(last=False)
+    return _GRAPH_CACHE[key].affinity(weight_mode, t)
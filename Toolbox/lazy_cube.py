@@ -0,0 +1,133 @@
+"""
+Description:
+    lazy access to hyperspectral cubes stored as .npy files or HDF5-based (v7.3) .mat files;
+    nothing is read until the cube is sliced, and only the requested bands / tiles are read
+"""
+import numpy as np
+
+MAT_SKIP_KEYS = ('__version__', '__header__', '__globals__', '#refs#', '#subsystem#')
+
+
+class LazyCube(object):
+    """
+    array-like view of a (n_row, n_column, n_band) cube, slicing returns an np.ndarray of the requested dtype;
+    index lists on several axes select their outer product (as np.ix_), not pairs of indices
+    """
+    def __init__(self, data, dtype=None, transpose=False, handle=None):
+        """
+        :param data: np.memmap or h5py.Dataset
+        :param dtype: dtype of the returned slices, None keeps the stored dtype
+        :param transpose: True for MATLAB v7.3 datasets, which are stored with the axes in reverse order
+        :param handle: open file to be closed with the cube
+        """
+        self.data = data
+        self.transpose = transpose
+        self.handle = handle
+        self.dtype = np.dtype(data.dtype if dtype is None else dtype)
+        self.shape = tuple(data.shape[::-1]) if transpose else tuple(data.shape)
+        self.ndim = len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        key = self.__expand_key(key)
+        if self.transpose:
+            # axes that survive the selection are read in reverse order as well
+            return self.__read(key[::-1]).transpose()
+        return self.__read(key)
+
+    def __array__(self, dtype=None, copy=None):
+        block = self[...]
+        return block if dtype is None else block.astype(dtype, copy=False)
+
+    def read_bands(self, band_index):
+        """
+        :param band_index: list of band indices, in any order
+        :return: np.ndarray of shape (n_row, n_column, len(band_index))
+        """
+        return self[:, :, list(band_index)]
+
+    def iter_tiles(self, tile_rows=64, band_index=None):
+        """
+        yield (row_start, tile) for horizontal tiles of tile_rows rows
+        :param tile_rows:
+        :param band_index: bands to read, None for all bands
+        :return:
+        """
+        bands = slice(None) if band_index is None else list(band_index)
+        for start in range(0, self.shape[0], tile_rows):
+            yield start, self[start:start + tile_rows, :, bands]
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def __expand_key(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = [j for j, k in enumerate(key) if k is Ellipsis][0]
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        return key + (slice(None),) * (self.ndim - len(key))
+
+    def __read(self, key):
+        """
+        read one selection from the stored data; h5py only accepts one increasing index list per selection,
+        so lists are read as sorted unique indices (or as a covering slice) and reordered in memory
+        """
+        reorder = []
+        stored_key = []
+        list_read = False
+        for axis, k in enumerate(key):
+            if isinstance(k, (list, np.ndarray)):
+                k = np.asarray(k, dtype=np.int64)
+                k[k < 0] += self.data.shape[axis]
+                unique, inverse = np.unique(k, return_inverse=True)
+                if not list_read:
+                    stored_key.append(unique.tolist())
+                    reorder.append(inverse)
+                    list_read = True
+                else:
+                    stored_key.append(slice(int(unique[0]), int(unique[-1]) + 1))
+                    reorder.append(k - unique[0])
+            else:
+                stored_key.append(k)
+                reorder.append(None if isinstance(k, slice) else False)
+        block = np.asarray(self.data[tuple(stored_key)])
+        # integer indices drop their axis
+        axis = 0
+        for r in reorder:
+            if r is False:
+                continue
+            if r is not None:
+                block = np.take(block, r, axis=axis)
+            axis += 1
+        return block.astype(self.dtype, copy=False)
+
+
+def is_hdf5(path):
+    with open(path, 'rb') as f:
+        header = f.read(512 + 8)
+    # the HDF5 signature is at offset 0, or at 512 for v7.3 .mat files behind the MATLAB header
+    return header[:8] == b'\x89HDF\r\n\x1a\n' or header[512:520] == b'\x89HDF\r\n\x1a\n'
+
+
+def open_cube(path, dtype=None, key=None):
+    """
+    open a cube lazily
+    :param path: .npy file, or HDF5-based (MATLAB v7.3) .mat file
+    :param dtype: dtype of the returned slices, None keeps the stored dtype
+    :param key: variable name in the .mat file, default the first array
+    :return: LazyCube
+    """
+    if path.endswith('.npy'):
+        return LazyCube(np.load(path, mmap_mode='r'), dtype=dtype)
+    if not is_hdf5(path):
+        raise ValueError('%s is not an HDF5 file, use scipy.io.loadmat for .mat files before v7.3' % path)
+    import h5py
+    handle = h5py.File(path, 'r')
+    if key is None:
+        key = [k for k in handle.keys() if k not in MAT_SKIP_KEYS and isinstance(handle[k], h5py.Dataset)][0]
+    return LazyCube(handle[key], dtype=dtype, transpose=True, handle=handle)
@@ -0,0 +1,88 @@
+"""
+Description:
+    grey-level openings and closings by a series of disks that reuse the work of the smaller radii;
+    when disk(r) is the Minkowski sum of a smaller disk and a small footprint C, the dilation / erosion by disk(r)
+    continues the one by the smaller disk with C instead of starting again from the image
+"""
+import numpy as np
+from scipy import ndimage as ndi
+
+
+def disk(radius):
+    """
+    flat disk footprint, same as skimage.morphology.disk
+    :param radius:
+    :return: bool array of shape (2 * radius + 1, 2 * radius + 1)
+    """
+    X, Y = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    return (X ** 2 + Y ** 2) <= radius ** 2
+
+
+def diamond(radius):
+    X, Y = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    return (np.abs(X) + np.abs(Y)) <= radius
+
+
+def minkowski_sum(A, C):
+    """
+    :param A: symmetric footprint
+    :param C: symmetric footprint
+    :return: footprint A + C
+    """
+    r_a, r_c = A.shape[0] // 2, C.shape[0] // 2
+    padded = np.zeros((A.shape[0] + 2 * r_c, A.shape[1] + 2 * r_c), dtype=bool)
+    padded[r_c:r_c + A.shape[0], r_c:r_c + A.shape[1]] = A
+    return ndi.binary_dilation(padded, structure=C)
+
+
+def disk_chain(disk_radius):
+    """
+    decomposition of every disk in disk_radius into footprints, disk(r) = C_1 + C_2 + ... (Minkowski sum),
+    checked on the footprints themselves; a disk that cannot be built from a smaller one with fewer
+    footprint pixels is a chain of its own
+    :param disk_radius: list of radii
+    :return: dict radius -> (previous radius or None, list of footprints from the first to the last)
+    """
+    chain = {}
+    for r in sorted(set(disk_radius)):
+        target = disk(r)
+        best = (None, [target])
+        for r_prev in sorted(chain, reverse=True):
+            factors = chain[r_prev][1]
+            for C in (disk(r - r_prev), diamond(r - r_prev)):
+                cost = sum(f.sum() for f in factors) + C.sum()
+                if cost < sum(f.sum() for f in best[1]) and np.array_equal(minkowski_sum(disk(r_prev), C), target):
+                    best = (r_prev, factors + [C])
+        chain[r] = best
+    return chain
+
+
+def _apply(image, factors, operator):
+    for footprint in factors:
+        image = operator(image, footprint=footprint)
+    return image
+
+
+def opening_closing_profile(image, disk_radius, chain=None):
+    """
+    closings and openings of one image by disk(r) for every r in disk_radius (scipy.ndimage, 'reflect' borders
+    as skimage.morphology.closing / opening); the dilations and erosions by successive disks are chained
+    :param image: 2D arr
+    :param disk_radius: list of radii
+    :param chain: see disk_chain
+    :return: list of closings, list of openings, in the order of disk_radius
+    """
+    if chain is None:
+        chain = disk_chain(disk_radius)
+    dilated, eroded = {}, {}
+    for r in sorted(chain):
+        r_prev, factors = chain[r]
+        if r_prev is None:
+            dilated[r] = _apply(image, factors, ndi.grey_dilation)
+            eroded[r] = _apply(image, factors, ndi.grey_erosion)
+        else:
+            dilated[r] = ndi.grey_dilation(dilated[r_prev], footprint=factors[-1])
+            eroded[r] = ndi.grey_erosion(eroded[r_prev], footprint=factors[-1])
+    closed = [_apply(dilated[r], chain[r][1], ndi.grey_erosion) for r in disk_radius]
+    opened = [_apply(eroded[r], chain[r][1], ndi.grey_dilation) for r in disk_radius]
+    return closed, opened
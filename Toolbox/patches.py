@@ -0,0 +1,55 @@
+"""
+Description:
+    lazy source of image patches centred on labeled pixels; the padded cube is kept once and patches are
+    gathered in batches from its strided rolling-window view, so only one batch is ever materialized
+"""
+import numpy as np
+from Toolbox.rolling_window import rolling_window as rw
+
+
+class PatchSource(object):
+
+    def __init__(self, img, gt, block_size=(5, 5)):
+        """
+        same padding, window and pixel order as Processor.divide_img_blocks
+        :param img: 3D arr (n_row, n_column, n_band)
+        :param gt: 2D arr (n_row, n_column), patches are centred on its nonzero pixels
+        :param block_size: tuple of size, it must be odd and >=3
+        """
+        w_1, w_2 = int((block_size[0] - 1) / 2), int((block_size[1] - 1) / 2)
+        self.block_size = block_size
+        self.img_padding = np.pad(img, ((w_1, w_2), (w_1, w_2), (0, 0)), 'symmetric')
+        gt_padding = np.pad(gt, ((w_1, w_2), (w_1, w_2)), 'symmetric')
+        # strided views, no copy
+        self.img_blocks = rw(self.img_padding, block_size, axes=(1, 0))
+        gt_blocks = rw(gt_padding, block_size, axes=(1, 0))
+        i_1, i_2 = int((block_size[0] - 1) / 2), int((block_size[0] - 1) / 2)
+        gt_center = gt_blocks[:, :, i_1, i_2]
+        self.rows, self.columns = gt_center.nonzero()
+        self.labels = gt_center[self.rows, self.columns]
+
+    def __len__(self):
+        return self.rows.shape[0]
+
+    @property
+    def shape(self):
+        return (len(self),) + self.img_blocks.shape[2:]
+
+    def __getitem__(self, item):
+        """
+        :param item: index, slice or index array of patches
+        :return: copy of the selected patches, shape (n, n_band) + window
+        """
+        return self.img_blocks[self.rows[item], self.columns[item]]
+
+    def iter_batches(self, batch_size=1024, index=None):
+        """
+        :param batch_size:
+        :param index: patches to visit, default all in the order of divide_img_blocks
+        :return: generator of (patches, labels)
+        """
+        if index is None:
+            index = np.arange(len(self))
+        for start in range(0, index.shape[0], batch_size):
+            batch = index[start:start + batch_size]
+            yield self[batch], self.labels[batch]
@@ -0,0 +1,65 @@
+"""
+Description:
+    helpers for walking a pixel matrix block by block, so that band-level statistics
+    can be accumulated without holding the whole (n_pixel, n_band) array in memory
+"""
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 2 ** 16
+
+
+def iter_blocks(source, chunk_size=None):
+    """
+    yield pixel blocks of shape (n_chunk, n_band) from a chunked source
+    :param source: 2-D array / np.memmap of shape (n_pixel, n_band), or an iterable of such blocks
+    :param chunk_size: number of pixels per block when source is an array
+    :return: generator of 2-D blocks
+    """
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    if hasattr(source, 'shape') and hasattr(source, '__getitem__'):
+        n_pixel = source.shape[0]
+        for start in range(0, n_pixel, chunk_size):
+            yield source[start:start + chunk_size]
+    else:
+        for block in source:
+            yield block
+
+
+def gram_matrix(source, chunk_size=None, center=False):
+    """
+    accumulate X^T X in one streaming pass, memory depends on n_band only
+    :param source: see iter_blocks
+    :param chunk_size:
+    :param center: if True, return the Gram matrix of the column-centered data (X - mean)^T (X - mean)
+    :return: float64 array of shape (n_band, n_band)
+    """
+    gram, col_sum, n_pixel = None, None, 0
+    for block in iter_blocks(source, chunk_size):
+        block = np.asarray(block, dtype=np.float64)
+        if gram is None:
+            gram = np.zeros((block.shape[1], block.shape[1]))
+            col_sum = np.zeros(block.shape[1])
+        gram += np.dot(block.transpose(), block)
+        col_sum += block.sum(axis=0)
+        n_pixel += block.shape[0]
+    if gram is None:
+        raise ValueError('source does not contain any pixel')
+    if center:
+        gram -= np.outer(col_sum, col_sum) / n_pixel
+    return gram
+
+
+def array_digest(source, chunk_size=None):
+    """
+    content hash of a pixel matrix, read block by block
+    :param source: array or np.memmap
+    :param chunk_size:
+    :return: hex digest string
+    """
+    import hashlib
+    digest = hashlib.sha1()
+    digest.update(str((tuple(source.shape), str(source.dtype))).encode('utf-8'))
+    for block in iter_blocks(source, chunk_size):
+        digest.update(np.ascontiguousarray(block).tobytes())
+    return digest.hexdigest()
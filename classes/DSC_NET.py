@@ -14,6 +14,7 @@ from scipy.sparse.linalg import svds
 from sklearn.preprocessing import normalize
 from tensorflow.examples.tutorials.mnist import input_data
 import copy
+from classes.utility import select_band_index, spectral_clustering_sweep
 
 
 class DSC_NET(object):
@@ -197,6 +198,21 @@ class DSC_NET(object):
 
     def post_proC(self, C, K, d, alpha):
         # C: coefficient matrix, K: number of clusters, d: dimension of each subspace
+        L = self.affinity_proC(C, K, d, alpha)
+        spectral = cluster.SpectralClustering(n_clusters=K, eigen_solver='arpack', affinity='precomputed',
+                                              assign_labels='discretize')
+        spectral.fit(L)
+        grp = spectral.fit_predict(L)
+        return grp, L
+
+    def post_proC_sweep(self, C, Ks, d, alpha):
+        # Ks: list of numbers of clusters; the affinity is built once with the rank of the largest K,
+        # and the spectral embedding is shared by all of them
+        L = self.affinity_proC(C, max(Ks), d, alpha)
+        grp = spectral_clustering_sweep(L, Ks, assign_labels='discretize', eigen_solver='arpack')
+        return grp, L
+
+    def affinity_proC(self, C, K, d, alpha):
         n = C.shape[0]
         C = 0.5 * (C + C.T)
         C = C - np.diag(np.diag(C)) + np.eye(n, n)  # for sparse C, this step will make the algorithm more numerically stable
@@ -213,11 +229,7 @@ class DSC_NET(object):
         L = np.abs(Z ** alpha)
         L = L / L.max()
         L = 0.5 * (L + L.T)
-        spectral = cluster.SpectralClustering(n_clusters=K, eigen_solver='arpack', affinity='precomputed',
-                                              assign_labels='discretize')
-        spectral.fit(L)
-        grp = spectral.fit_predict(L)
-        return grp, L
+        return L
 
     def cluster(self, X, n_cluster):
         n_row, n_column, n_band = X.shape
@@ -235,7 +247,10 @@ class DSC_NET(object):
                 print('# epoch %s' % (iter_ft))
                 all_loss.append(total_loss)
             C = self.thrC(C, alpha)
-            y_x, CKSym_x = self.post_proC(C, n_cluster, 1, 4)
+            if np.ndim(n_cluster) > 0:
+                y_x, CKSym_x = self.post_proC_sweep(C, n_cluster, 1, 4)
+            else:
+                y_x, CKSym_x = self.post_proC(C, n_cluster, 1, 4)
             print(all_loss)
             return y_x
                 # all_loss.append(total_loss)
@@ -271,22 +286,25 @@ class DSCBS(object):
 
     def predict(self, X):
         cluster_result = self.dsc.cluster(X, self.n_band)
-        selected_band = []
         n_row, n_column, n_band = X.shape
-        n_cluster = np.unique(cluster_result).__len__()
         img_ = X.reshape((n_row * n_column, -1))  # n_sample * n_band
-        for c in np.unique(cluster_result):
-            idx = np.nonzero(cluster_result == c)
-            center = np.mean(img_[:, idx[0]], axis=1).reshape((-1, 1))
-            distance = np.linalg.norm(img_[:, idx[0]] - center, axis=0)
-            band_ = img_[:, idx[0]][:, distance.argmin()]
-            selected_band.append(band_)
-        bands = np.asarray(selected_band)
-        bands = bands.reshape(n_cluster, n_row, n_column)
-        bands = np.transpose(bands, axes=(1, 2, 0))
-        self.bands = bands
+        self.band_index_ = select_band_index(cluster_result, img_)
+        self.bands = X[:, :, self.band_index_]
         return self.bands
 
+    def predict_sweep(self, X, n_bands):
+        """
+        :param X: Array-like with size (n_row, n_column, n_band)
+        :param n_bands: list of numbers of bands, all clustered from one trained network
+        :return: list of band indices, in the order of n_bands
+        """
+        cluster_results = self.dsc.cluster(X, n_bands)
+        n_row, n_column, n_band = X.shape
+        img_ = X.reshape((n_row * n_column, -1))  # n_sample * n_band
+        gram = np.dot(img_.T, img_)
+        self.band_indices_ = [select_band_index(cluster_result, gram=gram) for cluster_result in cluster_results]
+        return self.band_indices_
+
 
 # if __name__ == '__main__':
 #     from Toolbox.Preprocessing import Processor
@@ -15,6 +15,9 @@ from skfeature.function.sparse_learning_based import NDFS
 from skfeature.utility import construct_W
 from skfeature.utility.sparse_learning import feature_ranking
 from sklearn.cluster.spectral import SpectralClustering
+from Toolbox.streaming import gram_matrix
+from classes.self_expression import issc_coefficient
+from classes.utility import select_band_index, spectral_clustering_sweep
 
 
 class ISSC_HSI(object):
@@ -23,9 +26,10 @@ class ISSC_HSI(object):
         Implementation of L2 norm based sparse self-expressive clustering model
         with affinity measurement basing on angular similarity
     """
-    def __init__(self, n_band=10, coef_=1):
+    def __init__(self, n_band=10, coef_=1, chunk_size=None):
         self.n_band = n_band
         self.coef_ = coef_
+        self.chunk_size = chunk_size
 
     def fit(self, X):
         self.X = X
@@ -33,38 +37,89 @@ class ISSC_HSI(object):
 
     def predict(self, X):
         """
-        :param X: shape [n_row*n_clm, n_band]
-        :return: selected band subset
+        :param X: shape [n_row*n_clm, n_band], may be a np.memmap; it is read once in blocks of chunk_size pixels.
+                May also be an iterable of pixel blocks, which cannot be sliced: then only band_index_ is returned
+                and the caller reads the selected bands from its source
+        :return: selected band subset, taken from predict_sweep when it was run on the same X for n_band
         """
-        I = np.eye(X.shape[1])
-        coefficient_mat = -1 * np.dot(np.linalg.inv(np.dot(X.transpose(), X) + self.coef_ * I),
-                                      np.linalg.inv(np.diag(np.diag(np.dot(X.transpose(), X) + self.coef_ * I))))
-        temp = np.linalg.norm(coefficient_mat, axis=0).reshape(1, -1)
-        affinity = (np.dot(coefficient_mat.transpose(), coefficient_mat) /
-                    np.dot(temp.transpose(), temp))**2
+        if X is getattr(self, 'X', None) and self.n_band in getattr(self, 'sweep_', {}):
+            self.band_index_ = self.sweep_[self.n_band]
+        else:
+            gram = gram_matrix(X, chunk_size=self.chunk_size)
+            cluster_result = self.cluster_gram(gram)
+            # distances to the cluster centers come from the Gram matrix, X is not read a second time
+            self.band_index_ = select_band_index(cluster_result, gram=gram)
+        if not (hasattr(X, 'shape') and hasattr(X, '__getitem__')):
+            return self.band_index_
+        return X[:, self.band_index_]
 
-        sc = SpectralClustering(n_clusters=self.n_band, affinity='precomputed')
-        sc.fit(affinity)
-        selected_band = self.__get_band(sc.labels_, X)
-        return selected_band
+    def cluster_gram(self, gram):
+        """
+        cluster bands from the Gram matrix X^T X only, e.g. one built by Toolbox.streaming.gram_matrix
+        from an iterator of pixel blocks; classes.utility.select_band_index then picks the bands
+        :param gram: shape [n_band, n_band]
+        :return: cluster label of each band
+        """
+        coefficient_mat = issc_coefficient(gram, self.coef_)
+        affinity = self.__affinity(np.dot(coefficient_mat.transpose(), coefficient_mat))
+        return self.__spectral_clustering(affinity)
+
+    def predict_sweep(self, X, n_bands):
+        """
+        select bands for several numbers of bands from one Gram matrix, affinity and spectral embedding
+        :param X: shape [n_row*n_clm, n_band], read only once to build the Gram matrix
+        :param n_bands: list of numbers of bands
+        :return: list of band indices, in the order of n_bands
+        """
+        gram = gram_matrix(X, chunk_size=self.chunk_size)
+        coefficient_mat = issc_coefficient(gram, self.coef_)
+        affinity = self.__affinity(np.dot(coefficient_mat.transpose(), coefficient_mat))
+        labels = spectral_clustering_sweep(affinity, n_bands)
+        self.band_indices_ = [select_band_index(cluster_result, gram=gram) for cluster_result in labels]
+        self.X, self.sweep_ = X, dict(zip(n_bands, self.band_indices_))
+        return self.band_indices_
 
-    def __get_band(self, cluster_result, X):
+    def predict_path(self, X, coefs, reuse_tol=1e-3):
         """
-        select band according to the center of each cluster
-        :param cluster_result:
-        :param X:
+        regularization path: select bands for a whole grid of coef_ from one eigendecomposition
+        G = V diag(s) V^T, so that (G + lambda*I)^-1 = V diag(1 / (s + lambda)) V^T for every lambda.
+        :param X: shape [n_row*n_clm, n_band], read only once to build the Gram matrix
+        :param coefs: sequence of lambda values
+        :param reuse_tol: when the affinity moves less than this (relative Frobenius norm) from the
+                previous lambda, the previous clustering is reused instead of running spectral clustering again
+        :return: dict of lists indexed like coefs: 'coefficient_mat', 'affinity', 'labels', 'band_index'
+        """
+        gram = gram_matrix(X, chunk_size=self.chunk_size)
+        s, V = np.linalg.eigh(gram)
+        diag_gram = np.diag(gram)
+        res = {'coef_': list(coefs), 'coefficient_mat': [], 'affinity': [], 'labels': [], 'band_index': []}
+        affinity_prev, labels, band_index = None, None, None
+        for coef_ in res['coef_']:
+            inv_ = np.dot(V / (s + coef_), V.transpose())
+            coefficient_mat = -1 * inv_ / (diag_gram + coef_).reshape(1, -1)
+            # the column scaling cancels in the angular similarity, so C^T C can be replaced by (G + lambda*I)^-2
+            affinity = self.__affinity(np.dot(V / (s + coef_) ** 2, V.transpose()))
+            if affinity_prev is None or \
+                    np.linalg.norm(affinity - affinity_prev) > reuse_tol * np.linalg.norm(affinity_prev):
+                labels = self.__spectral_clustering(affinity)
+                band_index = select_band_index(labels, gram=gram)
+                affinity_prev = affinity
+            res['coefficient_mat'].append(coefficient_mat)
+            res['affinity'].append(affinity)
+            res['labels'].append(labels)
+            res['band_index'].append(band_index)
+        return res
+
+    def __affinity(self, cross_product):
+        """
+        squared angular similarity between the columns of the coefficient matrix
+        :param cross_product: C^T C, or any matrix equal to it up to a positive column/row scaling
         :return:
         """
-        selected_band = []
-        n_cluster = np.unique(cluster_result).__len__()
-        # img_ = X.reshape((n_row * n_column, -1))  # n_sample * n_band
-        for c in np.unique(cluster_result):
-            idx = np.nonzero(cluster_result == c)
-            center = np.mean(X[:, idx[0]], axis=1).reshape((-1, 1))
-            distance = np.linalg.norm(X[:, idx[0]] - center, axis=0)
-            band_ = X[:, idx[0]][:, distance.argmin()]
-            selected_band.append(band_)
-        bands = np.asarray(selected_band).transpose()
-        # bands = bands.reshape(n_cluster, n_row, n_column)
-        # bands = np.transpose(bands, axes=(1, 2, 0))
-        return bands
\ No newline at end of file
+        temp = np.sqrt(np.diag(cross_product)).reshape(1, -1)
+        return (cross_product / np.dot(temp.transpose(), temp)) ** 2
+
+    def __spectral_clustering(self, affinity):
+        sc = SpectralClustering(n_clusters=self.n_band, affinity='precomputed')
+        sc.fit(affinity)
+        return sc.labels_
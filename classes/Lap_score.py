@@ -1,39 +1,54 @@
 
-from skfeature.function.similarity_based import lap_score
 import numpy as np
-from skfeature.utility import construct_W
-
-
-class Lap_score_HSI(object):
-
-    def __init__(self, n_band=10):
+import scipy.sparse
+from Toolbox.knn_graph import knn_graph
+from classes.utility import RankingSelector
+
+
+def laplacian_score(X, W):
+    """
+    same score as skfeature's lap_score.lap_score, computed with sparse products only; skfeature densifies
+    D and L into two n_pixel x n_pixel matrices
+    :param X: shape [n_pixel, n_band]
+    :param W: sparse affinity, shape [n_pixel, n_pixel]
+    :return: score of every band, the smaller the better
+    """
+    X = np.asarray(X, dtype=np.float64)
+    W = scipy.sparse.csr_matrix(W)
+    d = np.asarray(W.sum(axis=1)).reshape(-1)
+    dx = np.dot(d, X)
+    D_prime = np.dot(d, X ** 2) - dx ** 2 / d.sum()
+    L_prime = np.sum(X * W.transpose().dot(X), axis=0) - dx ** 2 / d.sum()
+    # avoid the denominator of Lr to be 0
+    D_prime[D_prime < 1e-12] = 10000
+    return 1 - L_prime / D_prime
+
+
+class Lap_score_HSI(RankingSelector):
+
+    def __init__(self, n_band=10, n_components=None):
+        """
+        :param n_band:
+        :param n_components: dimension of the random projection used for an approximate kNN search, None for exact
+        """
         self.n_band = n_band
+        self.n_components = n_components
 
-    def fit(self, X):
-        self.X = X
-        return self
-
-    def predict(self, X):
+    def _rank(self, X):
         """
         :param X: shape [n_row*n_clm, n_band]
-        :return:
+        :return: all bands, best first
         """
         # n_row, n_column, __n_band = X.shape
         # XX = X.reshape((n_row * n_column, -1))  # n_sample * n_band
         XX = X
 
-        kwargs_W = {"metric": "euclidean", "neighbor_mode": "knn", "weight_mode": "heat_kernel", "k": 5, 't': 1}
-        W = construct_W.construct_W(XX, **kwargs_W)
+        # sparse kNN heat-kernel graph, same weights as construct_W with
+        # {"metric": "euclidean", "neighbor_mode": "knn", "weight_mode": "heat_kernel", "k": 5, 't': 1}
+        W = knn_graph(XX, k=5, weight_mode='heat_kernel', t=1, n_components=self.n_components)
 
         # obtain the scores of features
-        score = lap_score.lap_score(X, W=W)
+        score = laplacian_score(XX, W)
 
         # sort the feature scores in an ascending order according to the feature scores
-        idx = lap_score.feature_ranking(score)
-
-        # obtain the dataset on the selected features
-        selected_features = X[:, idx[0:self.n_band]]
-
-        # selected_features.reshape((self.n_band, n_row, n_column))
-        # selected_features = np.transpose(selected_features, axes=(1, 2, 0))
-        return selected_features
+        return np.argsort(score, 0)
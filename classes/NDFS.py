@@ -4,37 +4,123 @@ Reference:
     Li, Zechao, et al. "Unsupervised Feature Selection Using Nonnegative Spectral Analysis." AAAI. 2012.
 """
 import numpy as np
-from skfeature.function.sparse_learning_based import NDFS
-from skfeature.utility import construct_W
+import scipy.sparse
+from scipy.linalg import cho_factor, cho_solve
+from sklearn.cluster import KMeans
+from Toolbox.knn_graph import knn_graph
 from skfeature.utility.sparse_learning import feature_ranking
+from classes.utility import RankingSelector
 
 
-class NDFS_HSI(object):
+def kmeans_initialization(X, n_clusters):
+    """
+    scaled cluster indicator F = Y (Y^T Y)^-1/2 + 0.02 as in skfeature's NDFS
+    :param X:
+    :param n_clusters:
+    :return:
+    """
+    labels = KMeans(n_clusters=n_clusters, n_init=10, max_iter=300, tol=0.0001).fit(X).labels_
+    counts = np.bincount(labels, minlength=n_clusters).astype(np.float64)
+    F = np.zeros((X.shape[0], n_clusters))
+    F[np.arange(X.shape[0]), labels] = 1. / np.sqrt(np.maximum(counts, 1))[labels]
+    return F + 0.02
 
-    def __init__(self, n_cluster, n_band=10):
+
+def ndfs(X, W, n_clusters=None, F0=None, alpha=1, beta=1, gamma=10e8, max_iter=1000, tol=1e-5, dtype=np.float64,
+         laplacian='skfeature'):
+    """
+    NDFS with a sparse graph: M = L + alpha * (I - X T X^T) is only applied to F, never formed,
+    so every iteration is linear in the number of pixels
+    :param X: shape [n_pixel, n_band]
+    :param W: sparse affinity, shape [n_pixel, n_pixel]
+    :param n_clusters: used for the k-means initialization of F when F0 is None
+    :param F0: initial scaled cluster indicator, shape [n_pixel, n_clusters]
+    :param alpha:
+    :param beta:
+    :param gamma: weight of the orthogonality constraint on F
+    :param max_iter:
+    :param tol: stop when the relative change of the objective falls below tol
+    :param dtype: np.float32 halves the memory of the pixel-sized matrices, the n_band x n_band solve stays float64
+    :param laplacian: 'skfeature' (default) for the matrix of skfeature's NDFS, np.array(W.sum(1))[:, 0] - W,
+            i.e. L[i, j] = d[j] - W[i, j] (symmetrized there), which keeps the band rankings of the dense
+            implementation; 'graph' for the graph Laplacian L = diag(d) - W, which changes the rankings
+    :return: feature weight matrix of shape [n_band, n_clusters], objective value of every iteration
+    """
+    X = np.asarray(X, dtype=dtype)
+    W = scipy.sparse.csr_matrix(W, dtype=dtype)
+    W = (W + W.transpose()) / 2
+    d = np.asarray(W.sum(axis=1)).reshape(-1)
+    if laplacian == 'skfeature':
+        # (L + L^T) / 2 = (1 d^T + d 1^T) / 2 - W, applied as a rank-two update of the sparse W
+        def L_dot(F):
+            return 0.5 * (np.dot(d, F).reshape(1, -1) + d.reshape(-1, 1) * F.sum(axis=0).reshape(1, -1)) - W.dot(F)
+    else:
+        L_dot = (scipy.sparse.diags(d) - W).dot
+    F = kmeans_initialization(X, n_clusters) if F0 is None else F0
+    F = np.asarray(F, dtype=dtype)
+    n_samples, n_features = X.shape
+
+    XtX = np.dot(X.transpose(), X).astype(np.float64)
+    D = np.ones(n_features)
+    obj = []
+    for iter_step in range(max_iter):
+        # update W, T = (X^T X + beta*D + 1e-6*I)^-1
+        factor = cho_factor(XtX + np.diag(beta * D + 1e-6))
+        Weight = cho_solve(factor, np.dot(X.transpose(), F).astype(np.float64))
+        # update D
+        temp = np.sqrt((Weight * Weight).sum(1))
+        temp[temp < 1e-16] = 1e-16
+        D = 0.5 / temp
+        # update F, using X T X^T F = X Weight
+        XW = np.dot(X, Weight.astype(dtype))
+        MF = L_dot(F) + alpha * (F - XW)
+        denominator = MF + gamma * np.dot(F, np.dot(F.transpose(), F))
+        F = F * (gamma * F) / denominator
+        F = F * np.sqrt(1 / (np.diag(np.dot(F.transpose(), F)) + 1e-16)).reshape(1, -1)
+        # objective Tr(F^T L F) + alpha * (||XW - F||^2 + beta * ||W||_2,1)
+        obj.append(float(np.sum(F * L_dot(F)) +
+                         alpha * (np.sum((XW - F) ** 2) + beta * np.sqrt((Weight * Weight).sum(1)).sum())))
+        if iter_step > 0 and abs(obj[-1] - obj[-2]) <= tol * abs(obj[-2]):
+            break
+    return Weight, np.asarray(obj)
+
+
+class NDFS_HSI(RankingSelector):
+
+    def __init__(self, n_cluster, n_band=10, n_components=None, max_iter=1000, tol=1e-5, dtype=np.float64,
+                 laplacian='skfeature'):
+        """
+        :param n_cluster:
+        :param n_band:
+        :param n_components: dimension of the random projection used for an approximate kNN search, None for exact
+        :param max_iter:
+        :param tol: relative objective change for early stopping
+        :param dtype: np.float32 or np.float64
+        :param laplacian: 'skfeature' reproduces the rankings of skfeature's NDFS, 'graph' opts in to the
+                graph Laplacian, see ndfs
+        """
         self.n_band = n_band
         self.n_cluster = n_cluster
+        self.n_components = n_components
+        self.max_iter = max_iter
+        self.tol = tol
+        self.dtype = dtype
+        self.laplacian = laplacian
 
-    def fit(self, X):
-        self.X = X
-        return self
-
-    def predict(self, X):
+    def _rank(self, X):
         """
 
         :param X: shape [n_row*n_clm, n_band]
-        :return:
+        :return: all bands, best first
         """
-        # construct affinity matrix
-        kwargs = {"metric": "euclidean", "neighborMode": "knn", "weightMode": "heatKernel", "k": 5, 't': 1}
-        W = construct_W.construct_W(X, **kwargs)
+        # construct affinity matrix; construct_W ignored the camel-case keys of
+        # {"metric": "euclidean", "neighborMode": "knn", "weightMode": "heatKernel", "k": 5, 't': 1}
+        # and fell back to a binary kNN graph, the neighbour search is shared with Lap_score_HSI
+        W = knn_graph(X, k=5, weight_mode='binary', n_components=self.n_components)
 
-        # obtain the feature weight matrix
-        Weight = NDFS.ndfs(X, W=W, n_clusters=self.n_cluster)
+        # obtain the feature weight matrix, the objective trace is kept in obj_
+        Weight, self.obj_ = ndfs(X, W, n_clusters=self.n_cluster, max_iter=self.max_iter, tol=self.tol,
+                                 dtype=self.dtype, laplacian=self.laplacian)
 
         # sort the feature scores in an ascending order according to the feature scores
-        idx = feature_ranking(Weight)
-
-        # obtain the dataset on the selected features
-        selected_features = X[:, idx[0:self.n_band]]
-        return selected_features
+        return feature_ranking(Weight)
@@ -5,6 +5,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import nimfa
 from sklearn.metrics import accuracy_score
+from classes.utility import select_band_index
 
 class BandSelection_SNMF(object):
     def __init__(self, n_band):
@@ -30,16 +31,9 @@ class BandSelection_SNMF(object):
         cluster_res = indx_sort[-1].reshape(-1)
 
         #  select band
-        selected_band = []
-        for c in np.unique(cluster_res):
-            idx = np.nonzero(cluster_res == c)
-            center = np.mean(X[:, idx[0]], axis=1).reshape((-1, 1))
-            distance = np.linalg.norm(X[:, idx[0]] - center, axis=0)
-            band_ = X[:, idx[0]][:, distance.argmin()]
-            selected_band.append(band_)
-        while selected_band.__len__() < self.n_band:
-            selected_band.append(np.zeros(X.shape[0]))
-        bands = np.asarray(selected_band).transpose()
+        self.band_index_ = select_band_index(cluster_res, X)
+        bands = np.zeros((X.shape[0], self.n_band), dtype=X.dtype)
+        bands[:, :self.band_index_.shape[0]] = X[:, self.band_index_]
         return bands
 
     # # 得到W和H
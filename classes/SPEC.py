@@ -6,37 +6,124 @@ Ref:
 """
 from skfeature.function.similarity_based import SPEC
 import numpy as np
+from scipy.sparse.linalg import LinearOperator, aslinearoperator, eigsh
+from sklearn.metrics.pairwise import rbf_kernel
+from Toolbox.knn_graph import knn_graph
+from Toolbox.streaming import iter_blocks
+from classes.utility import RankingSelector
 
 
-class SPEC_HSI(object):
+def nystroem_similarity(X, n_landmark=500, gamma=1., random_state=None, chunk_size=None):
+    """
+    low-rank RBF similarity W ~ Z Z^T from randomly chosen landmark pixels (Nystroem approximation)
+    :param X: shape [n_pixel, n_band]
+    :param n_landmark:
+    :param gamma: RBF parameter, SPEC.spec uses rbf_kernel(X, gamma=1)
+    :param random_state:
+    :param chunk_size:
+    :return: LinearOperator of shape [n_pixel, n_pixel]
+    """
+    rng = np.random.RandomState(random_state)
+    landmark = np.sort(rng.choice(X.shape[0], min(n_landmark, X.shape[0]), replace=False))
+    X_landmark = np.asarray(X[landmark], dtype=np.float64)
+    s, U = np.linalg.eigh(rbf_kernel(X_landmark, gamma=gamma))
+    keep = s > s.max() * 1e-10
+    projection = U[:, keep] / np.sqrt(s[keep])
+    Z = np.concatenate([np.dot(rbf_kernel(np.asarray(block, dtype=np.float64), X_landmark, gamma=gamma), projection)
+                        for block in iter_blocks(X, chunk_size)])
+    n_pixel = Z.shape[0]
+    return LinearOperator((n_pixel, n_pixel), matvec=lambda v: np.dot(Z, np.dot(Z.transpose(), v)),
+                          matmat=lambda V: np.dot(Z, np.dot(Z.transpose(), V)), dtype=np.float64)
 
-    def __init__(self, n_band=10):
-        self.n_band = n_band
 
-    def fit(self, X):
-        self.X = X
-        return self
+def spec_score(X, W, style=0):
+    """
+    SPEC feature scores without the dense eigendecomposition of SPEC.spec; for style -1 and 0 the scores follow
+    from f'Lf / f'Df, for style > 0 only the `style` smallest eigenpairs of the normalized Laplacian are computed
+    with the Lanczos solver
+    :param X: shape [n_pixel, n_band]
+    :param W: similarity as a sparse matrix or a LinearOperator, shape [n_pixel, n_pixel]
+    :param style: ranking function as in SPEC.spec
+    :return: feature scores, to be ranked with SPEC.feature_ranking
+    """
+    W = aslinearoperator(W)
+    n_samples, n_features = X.shape
+    X = np.asarray(X, dtype=np.float64)
+    degree = W.matvec(np.ones(n_samples))
+    degree = np.maximum(degree, np.finfo(np.float64).tiny)
+    d1, d2 = np.power(degree, -0.5), np.power(degree, 0.5)
+    v = d2 / np.linalg.norm(d2)
+    # ||D^1/2 f|| of every feature, F_hat = D^1/2 f / l
+    l = np.sqrt(np.dot(degree, X ** 2))
+    valid = l >= 100 * np.spacing(1)
+    F_hat = d2.reshape(-1, 1) * X / np.where(valid, l, 1.)
+    w_fea = np.ones(n_features) * 1000
+    if style == -1 or style == 0:
+        # F_hat' L_hat F_hat = 1 - (D^-1/2 F_hat)' W (D^-1/2 F_hat)
+        G = d1.reshape(-1, 1) * F_hat
+        quad = 1 - np.sum(G * W.matmat(G), axis=0)
+        if style == 0:
+            # the trivial eigenvector v of L_hat has eigenvalue 0
+            quad = quad / (1 - np.dot(v, F_hat) ** 2)
+        w_fea[valid] = quad[valid]
+    else:
+        A = LinearOperator((n_samples, n_samples), matvec=lambda x: d1 * W.matvec(d1 * x), dtype=np.float64)
+        mu, U = eigsh(A, k=style, which='LA')
+        # eigenvalues of L_hat in ascending order, the first one is the trivial 0
+        order = np.argsort(mu)[::-1]
+        s, U = 1 - mu[order], U[:, order]
+        a = np.dot(U[:, 1:].transpose(), F_hat) ** 2
+        w_fea[valid] = np.dot(2 - s[1:], a)[valid]
+        w_fea[w_fea == 1000] = -1000
+    return w_fea
+
+
+class SPEC_HSI(RankingSelector):
+
+    def __init__(self, n_band=10, style=0, mode='exact', n_landmark=500, n_neighbors=5, gamma=1.,
+                 random_state=None):
+        """
+        :param n_band:
+        :param style: ranking function of SPEC.spec
+        :param mode: 'exact' (dense RBF similarity, SPEC.spec), 'nystroem' (landmark approximation of the RBF
+                similarity) or 'knn' (sparse kNN RBF similarity); the last two need memory linear in pixels
+        :param n_landmark: landmarks of the 'nystroem' mode
+        :param n_neighbors: neighbour size of the 'knn' mode
+        :param gamma: RBF parameter
+        :param random_state: landmark seed
+        """
+        self.n_band = n_band
+        self.style = style
+        self.mode = mode
+        self.n_landmark = n_landmark
+        self.n_neighbors = n_neighbors
+        self.gamma = gamma
+        self.random_state = random_state
 
-    def predict(self, X):
+    def _rank(self, X):
         """
 
         :param X: shape [n_row*n_clm, n_band]
-        :return:
+        :return: all bands, best first
         """
         # specify the second ranking function which uses all except the 1st eigenvalue
-        kwargs = {'style': 0}
+        kwargs = {'style': self.style}
         # n_row, n_column, __n_band = X.shape
         # XX = X.reshape((n_row * n_column, -1))  # n_sample * n_band
         XX = X
 
         # obtain the scores of features
-        score = SPEC.spec(XX, **kwargs)
+        if self.mode == 'exact':
+            score = SPEC.spec(XX, W=rbf_kernel(XX, gamma=self.gamma), **kwargs)
+        elif self.mode == 'nystroem':
+            W = nystroem_similarity(XX, self.n_landmark, self.gamma, self.random_state)
+            score = spec_score(XX, W, **kwargs)
+        elif self.mode == 'knn':
+            # exp(-gamma * d^2) is the heat kernel with 2t^2 = 1 / gamma
+            W = knn_graph(XX, k=self.n_neighbors, weight_mode='heat_kernel', t=np.sqrt(0.5 / self.gamma))
+            score = spec_score(XX, W, **kwargs)
+        else:
+            raise ValueError('mode must be exact, nystroem or knn')
 
         # sort the feature scores in an descending order according to the feature scores
-        idx = SPEC.feature_ranking(score, **kwargs)
-
-        # obtain the dataset on the selected features
-        selected_features = XX[:, idx[0:self.n_band]]
-        # selected_features.reshape((self.n_band, n_row, n_column))
-        # selected_features = np.transpose(selected_features, axes=(1, 2, 0))
-        return selected_features
+        return SPEC.feature_ranking(score, **kwargs)
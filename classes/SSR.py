@@ -11,33 +11,26 @@ import cvxpy as cvx
 import numpy as np
 from sklearn.base import BaseEstimator, ClassifierMixin
 from sklearn.cluster import KMeans
-from sklearn.linear_model import OrthogonalMatchingPursuit  # OMP compute coef. column by column
 from sklearn.metrics import pairwise_distances
+from Toolbox.streaming import gram_matrix
+from classes.self_expression import loo_ridge_coefficient, omp_self_expression, l1_self_expression
 
 
 class SSC_BS(BaseEstimator, ClassifierMixin):
     """
     """
-    def __init__(self, n_hidden, n_clusters, lambda_coef=1):
+    def __init__(self, n_hidden, n_clusters, lambda_coef=1, n_jobs=1):
         self.n_hidden = n_hidden
         self.n_clusters = n_clusters
         self.lambda_coef = lambda_coef
+        self.n_jobs = n_jobs
 
     def fit_predict_omp(self, X, y=None):
         n_sample = X.transpose().shape[0]
-        H = X.transpose()      #NRP_ELM(self.n_hidden, sparse=False).fit(X).predict(X)
-        C = np.zeros((n_sample, n_sample))
-        # solve sparse self-expressive representation
-        for i in range(n_sample):
-            y_i = H[i]
-            H_i = np.delete(H, i, axis=0)
-            # H_T = H_i.transpose()  # M x (N-1)
-            omp = OrthogonalMatchingPursuit(n_nonzero_coefs=int(n_sample * 0.5), tol=1e20)
-            omp.fit(H_i.transpose(), y_i)
-            #  Normalize the columns of C: ci = ci / ||ci||_ss.
-            coef = omp.coef_ / np.max(np.abs(omp.coef_))
-            C[:i, i] = coef[:i]
-            C[i+1:, i] = coef[i:]
+        # solve sparse self-expressive representation for all bands from one centered Gram matrix,
+        # same settings as OrthogonalMatchingPursuit(n_nonzero_coefs=int(n_sample * 0.5), tol=1e20)
+        C = omp_self_expression(gram_matrix(X, center=True), n_nonzero_coefs=int(n_sample * 0.5), tol=1e20,
+                                n_jobs=self.n_jobs)
         # # compute affinity matrix
         # L = 0.5 * (np.abs(C) + np.abs(C.T))  # affinity graph
         # # L = 0.5 * (C + C.T)
@@ -46,22 +39,7 @@ class SSC_BS(BaseEstimator, ClassifierMixin):
         # sc = SpectralClustering(n_clusters=self.n_clusters, affinity='precomputed')
         # sc.fit(self.affinity_matrix)
         # K-means clustering
-        kmeans = KMeans(n_clusters=self.n_clusters, max_iter=500).fit(C)
-        label = kmeans.labels_
-        C_ = C
-        band_index = []
-        for i in np.unique(label):
-            index__ = np.nonzero(label == i)
-            centroids_ = C_[index__]
-            centroids = centroids_.mean(axis=0)
-            dis = pairwise_distances(centroids_, centroids.reshape((1, centroids_.shape[1]))).flatten()
-            index_min = np.argmin(dis)
-            C_bestrow = centroids_[index_min, :]
-            index = np.nonzero(np.all(C_ == C_bestrow, axis=1))
-            band_index.append(index[0][0])
-        BandData = X[:, band_index]  # BandData = self.X[:, band_index]
-        print('selected band:', band_index)
-        return BandData  #sc.labels_
+        return self.__kmeans_band(C, X)
 
     def fit_predict_close(self, X, raw_input_=False):
         """
@@ -70,44 +48,15 @@ class SSC_BS(BaseEstimator, ClassifierMixin):
         :param raw_input_:
         :return:
         """
-        n_sample = X.transpose().shape[0]
-        if raw_input_ is True:
-            H = X.transpose()
-        else:
-            H = X.transpose()    #NRP_ELM(self.n_hidden, sparse=False).fit(X).predict(X)
-        C = np.zeros((n_sample, n_sample))
-        for i in range(n_sample):
-            y_i = H[i]
-            H_i = np.delete(H, i, axis=0).transpose()
-            term_1 = np.linalg.inv(np.dot(H_i.transpose(), H_i) + self.lambda_coef * np.eye(n_sample - 1))
-            w = np.dot(np.dot(term_1, H_i.transpose()), y_i.reshape((y_i.shape[0], 1)))
-            w = w.flatten()
-            #  Normalize the columns of C: ci = ci / ||ci||_ss.
-            coef = w / np.max(np.abs(w))
-            C[:i, i] = coef[:i]
-            C[i + 1:, i] = coef[i:]
+        # every leave-one-out ridge column comes from one factorization of H H^T + lambda*I
+        C = loo_ridge_coefficient(gram_matrix(X), self.lambda_coef)
         # # compute affinity matrix
         # L = 0.5 * (np.abs(C) + np.abs(C.T))  # affinity graph
         # self.affinity_matrix = L
         # # spectral clustering
         # sc = SpectralClustering(n_clusters=self.n_clusters, affinity='precomputed')
         # sc.fit(self.affinity_matrix)
-        kmeans = KMeans(n_clusters=self.n_clusters, max_iter=500).fit(C)
-        label = kmeans.labels_
-        C_ = C
-        band_index = []
-        for i in np.unique(label):
-            index__ = np.nonzero(label == i)
-            centroids_ = C_[index__]
-            centroids = centroids_.mean(axis=0)
-            dis = pairwise_distances(centroids_, centroids.reshape((1, centroids_.shape[1]))).flatten()
-            index_min = np.argmin(dis)
-            C_bestrow = centroids_[index_min, :]
-            index = np.nonzero(np.all(C_ == C_bestrow, axis=1))
-            band_index.append(index[0][0])
-        BandData = X[:, band_index]  # BandData = self.X[:, band_index]
-        print('selected band:', band_index)
-        return BandData  # sc.labels_
+        return self.__kmeans_band(C, X)
 
     def fit_predict_cvx(self, X):
         n_sample = X.transpose().shape[0]
@@ -137,6 +86,32 @@ class SSC_BS(BaseEstimator, ClassifierMixin):
         # sc = SpectralClustering(n_clusters=self.n_clusters, affinity='precomputed')
         # sc.fit(self.affinity_matrix)
         # k-means clustering
+        return self.__kmeans_band(C, X)
+
+    def fit_predict_l1(self, X, max_iter=1000, tol=1e-6):
+        """
+        same model as fit_predict_cvx, solved for all bands from X^T X by the LARS-Lasso homotopy
+        instead of one cvxpy problem per band
+        :param X:
+        :param max_iter: homotopy steps per band
+        :param tol: relative duality gap above which a ConvergenceWarning is raised
+        :return:
+        """
+        self.coef_mat_, self.duality_gap_ = l1_self_expression(gram_matrix(X), self.lambda_coef,
+                                                               max_iter=max_iter, tol=tol)
+        #  Normalize the columns of C: ci = ci / ||ci||_ss.
+        # a column is exactly zero once 0.5*lambda >= max|G[-i, i]|, it is kept as zero instead of 0 / 0
+        col_max = np.max(np.abs(self.coef_mat_), axis=0).reshape(1, -1)
+        C = self.coef_mat_ / np.maximum(col_max, np.finfo(np.float64).eps)
+        return self.__kmeans_band(C, X)
+
+    def __kmeans_band(self, C, X):
+        """
+        k-means clustering on the rows of C, keep the band closest to each centroid
+        :param C:
+        :param X:
+        :return:
+        """
         kmeans = KMeans(n_clusters=self.n_clusters, max_iter=500).fit(C)
         label = kmeans.labels_
         C_ = C
@@ -150,6 +125,6 @@ class SSC_BS(BaseEstimator, ClassifierMixin):
             C_bestrow = centroids_[index_min, :]
             index = np.nonzero(np.all(C_ == C_bestrow, axis=1))
             band_index.append(index[0][0])
-        BandData = X[:, band_index]   #BandData = self.X[:, band_index]
-        print ('selected band:', band_index)
+        BandData = X[:, band_index]  # BandData = self.X[:, band_index]
+        print('selected band:', band_index)
         return BandData  #sc.labels_
@@ -3,46 +3,77 @@
 
 import numpy as np
 import scipy as sp
+import scipy.sparse.linalg
 from sklearn.linear_model import orthogonal_mp_gram
+from Toolbox.streaming import iter_blocks
 
 
 class ApproximateKSVD(object):
     def __init__(self, n_components, max_iter=10, tol=1e-6,
-                 transform_n_nonzero_coefs=None):
+                 transform_n_nonzero_coefs=None, batch_size=None, chunk_size=None):
         """
         Parameters
         ----------
         n_components:
             Number of dictionary elements
         max_iter:
-            Maximum number of iterations
+            Maximum number of iterations (passes over the data in mini-batch mode)
         tol:
             tolerance for error
         transform_n_nonzero_coefs:
             Number of nonzero coefficients to target
+        batch_size:
+            If given, fit streams blocks of batch_size pixels and updates the dictionary online
+            from accumulated statistics (mini-batch mode), so X can be a np.memmap larger than memory
+        chunk_size:
+            Number of pixels encoded at once, bounds the dense OMP output
         """
         self.components_ = None
         self.max_iter = max_iter
         self.tol = tol
         self.n_components = n_components
         self.transform_n_nonzero_coefs = transform_n_nonzero_coefs
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
 
     def _update_dict(self, X, D, gamma):
+        """
+        gamma is a csc_matrix of shape (n_samples, n_components), updated in place;
+        each atom only touches the samples in its sparse support
+        """
+        gamma_csr = sp.sparse.csc_matrix((np.arange(gamma.nnz, dtype=np.float64), gamma.indices, gamma.indptr),
+                                         shape=gamma.shape).tocsr()
+        # position in gamma.data of every entry, in row-major order
+        position = gamma_csr.data.astype(np.int64)
         for j in range(self.n_components):
-            I = gamma[:, j] > 0
-            if np.sum(I) == 0:
+            segment = gamma.data[gamma.indptr[j]:gamma.indptr[j + 1]]
+            positive = segment > 0
+            if np.sum(positive) == 0:
                 continue
+            I = gamma.indices[gamma.indptr[j]:gamma.indptr[j + 1]][positive]
 
             D[j, :] = 0
-            g = gamma[I, j].T
-            r = X[I, :] - gamma[I, :].dot(D)
+            g = segment[positive]
+            r = X[I, :] - self._rows(gamma_csr, position, gamma.data, I).dot(D)
             d = r.T.dot(g)
             d /= np.linalg.norm(d)
             g = r.dot(d)
             D[j, :] = d
-            gamma[I, j] = g.T
+            segment[positive] = g
         return D, gamma
 
+    @staticmethod
+    def _rows(gamma_csr, position, data, I):
+        """
+        rows I of the code matrix as a csr_matrix, reading the current values from the csc data array
+        """
+        starts = gamma_csr.indptr[I]
+        counts = gamma_csr.indptr[I + 1] - starts
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        entry = np.repeat(starts - indptr[:-1], counts) + np.arange(indptr[-1])
+        return sp.sparse.csr_matrix((data[position[entry]], gamma_csr.indices[entry], indptr),
+                                    shape=(I.shape[0], gamma_csr.shape[1]))
+
     def _initialize(self, X):
         if min(X.shape) <= self.n_components:
             D = np.random.randn(self.n_components, X.shape[1])
@@ -63,16 +94,49 @@ class ApproximateKSVD(object):
         return orthogonal_mp_gram(
             gram, Xy, n_nonzero_coefs=n_nonzero_coefs).T
 
+    def _iter_codes(self, D, X):
+        for block in iter_blocks(X, self.chunk_size):
+            yield block, self._transform(D, block)
+
+    def iter_transform(self, X):
+        """
+        encode X block by block with the fitted dictionary, the codes of one block are dense
+
+        Returns
+        -------
+        generator of (X block, codes of shape [n_block, n_components])
+        """
+        return self._iter_codes(self.components_, X)
+
+    def _encode(self, D, X):
+        """
+        sparse codes of X and the reconstruction error ||X - gamma.dot(D)||, without forming the residual
+        """
+        blocks, norm_sq, cross = [], 0., 0.
+        for block, codes in self._iter_codes(D, X):
+            norm_sq += np.sum(np.square(block, dtype=np.float64))
+            cross += np.sum(codes * np.dot(block, D.T))
+            blocks.append(sp.sparse.csr_matrix(codes))
+        gamma = sp.sparse.vstack(blocks).tocsc()
+        gamma_gram = gamma.T.dot(gamma).toarray()
+        e = np.sqrt(max(norm_sq - 2 * cross + np.sum(gamma_gram * D.dot(D.T)), 0.))
+        return gamma, e
+
     def fit(self, X):
         """
         Parameters
         ----------
         X: shape = [n_samples, n_features]
         """
+        if self.batch_size is not None:
+            self.components_ = None
+            for i in range(self.max_iter):
+                for block in iter_blocks(X, self.batch_size):
+                    self.partial_fit(block)
+            return self
         D = self._initialize(X)
         for i in range(self.max_iter):
-            gamma = self._transform(D, X)
-            e = np.linalg.norm(X - gamma.dot(D))
+            gamma, e = self._encode(D, X)
             if e < self.tol:
                 break
             D, gamma = self._update_dict(X, D, gamma)
@@ -80,15 +144,47 @@ class ApproximateKSVD(object):
         self.components_ = D
         return self
 
+    def partial_fit(self, X):
+        """
+        online dictionary update from one block of samples (Mairal et al., 2009): the block is encoded with
+        the current dictionary, the statistics A = sum gamma^T gamma and B = sum X^T gamma are accumulated
+        and every atom takes one block-coordinate step on them
+
+        Parameters
+        ----------
+        X: shape = [n_block, n_features]
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if self.components_ is None:
+            self.components_ = self._initialize(X)
+            self._A = np.zeros((self.n_components, self.n_components))
+            self._B = np.zeros((X.shape[1], self.n_components))
+        D = self.components_
+        codes = self._transform(D, X)
+        self._A += codes.T.dot(codes)
+        self._B += X.T.dot(codes)
+        for j in range(self.n_components):
+            if self._A[j, j] < np.finfo(np.float64).eps:
+                continue
+            u = (self._B[:, j] - D.T.dot(self._A[:, j])) / self._A[j, j] + D[j, :]
+            D[j, :] = u / np.linalg.norm(u)
+        return self
+
     def transform(self, X):
-        return self._transform(self.components_, X)
+        """
+        Returns
+        -------
+        sparse codes as a csc_matrix of shape [n_samples, n_components]
+        """
+        return self._encode(self.components_, X)[0]
 
 
 class SpaBS(object):
 
-    def __init__(self, n_band, sparsity_level=0.5):
+    def __init__(self, n_band, sparsity_level=0.5, batch_size=None):
         self.n_band = n_band
         self.sparsity_level = sparsity_level
+        self.batch_size = batch_size
 
     def fit(self, X):
         self.X = X
@@ -106,17 +202,19 @@ class SpaBS(object):
         # 调用ksvd
         # TODO: according to ref., X has to be with shape (n_band, n_sample)
         # X = X.transpose()
-        dico = ApproximateKSVD(n_components=X.shape[1])
+        dico = ApproximateKSVD(n_components=X.shape[1], batch_size=self.batch_size)
         dico.fit(X)
-        gamma_ = dico.transform(X)  # gamma为系数矩阵, shape(n_sample, n_atom)
-        gamma = gamma_.transpose()
-        sorted_inx = np.argsort(gamma, axis=0)  # ascending order for each column
-        K = X.shape[0] * self.sparsity_level
-        largest_k = sorted_inx[-self.n_band:, :]
+        # gamma为系数矩阵, shape(n_sample, n_atom); it is encoded chunk by chunk and only the vote counts are kept
+        n_largest = min(self.n_band, X.shape[1])
+        freq = np.zeros(X.shape[1], dtype=np.int64)
+        for block, gamma in dico.iter_transform(X):
+            # the n_band largest coefficients of each pixel, partial selection instead of a full argsort
+            largest_k = np.argpartition(gamma, -n_largest, axis=1)[:, -n_largest:]
+            freq += np.bincount(largest_k.ravel(), minlength=X.shape[1])
 
         # # statistic
-        element, freq = np.unique(largest_k, return_counts=True)
-        selected_inx = element[np.argsort(freq)][-self.n_band:]
+        selected_inx = np.argsort(freq)[-self.n_band:]
+        self.band_frequency_ = freq
         selected_band = X[:, selected_inx]
         return selected_band
 
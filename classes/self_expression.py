@@ -0,0 +1,190 @@
+"""
+Description:
+    solvers for self-expressive band models X ~ XC that work on the Gram matrix G = X^T X,
+    so that the pixel data only has to be touched once
+"""
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+
+
+def regularized_inverse(gram, coef_):
+    """
+    (G + lambda*I)^-1 through a Cholesky factorization
+    :param gram: X^T X, shape (n_band, n_band)
+    :param coef_: lambda
+    :return:
+    """
+    A = gram + coef_ * np.eye(gram.shape[0])
+    factor = cho_factor(A)
+    return cho_solve(factor, np.eye(gram.shape[0]))
+
+
+def issc_coefficient(gram, coef_):
+    """
+    closed-form ISSC coefficient matrix  W = -(G + lambda*I)^-1 (diag(G + lambda*I))^-1
+    :param gram: X^T X, shape (n_band, n_band)
+    :param coef_: lambda
+    :return: coefficient matrix, shape (n_band, n_band)
+    """
+    inv_ = regularized_inverse(gram, coef_)
+    # right-multiplying by a diagonal matrix only rescales the columns
+    return -1 * inv_ / (np.diag(gram) + coef_).reshape(1, -1)
+
+
+def loo_ridge_coefficient(gram, coef_):
+    """
+    leave-one-out ridge self-expression for every band from a single factorization,
+    column i solves  min ||x_i - X_{-i} w||^2 + lambda*||w||^2  and is scaled by its largest magnitude.
+    With P = (G + lambda*I)^-1 the block-inverse identity gives w = -P[-i, i] / P[i, i].
+    :param gram: X^T X, shape (n_band, n_band)
+    :param coef_: lambda
+    :return: C with zero diagonal, shape (n_band, n_band)
+    """
+    inv_ = regularized_inverse(gram, coef_)
+    C = -1 * inv_ / np.diag(inv_).reshape(1, -1)
+    np.fill_diagonal(C, 0)
+    #  Normalize the columns of C: ci = ci / ||ci||_ss.
+    C /= np.max(np.abs(C), axis=0).reshape(1, -1)
+    return C
+
+
+def gram_omp(gram, Xy, norm_sq, n_nonzero_coefs, tol=None, exclude=None):
+    """
+    orthogonal matching pursuit on a precomputed Gram matrix (Cholesky update as in sklearn's orthogonal_mp_gram)
+    where the atoms flagged in `exclude` can never be selected, so a column can be left out without copying
+    :param gram: D^T D, shape (n_atom, n_atom)
+    :param Xy: D^T y, shape (n_atom,)
+    :param norm_sq: ||y||^2, only used with tol
+    :param n_nonzero_coefs: maximum number of atoms, ignored when tol is given
+    :param tol: maximum squared residual norm, overrides n_nonzero_coefs
+    :param exclude: boolean mask of forbidden atoms
+    :return: coefficient vector, shape (n_atom,)
+    """
+    n_atom = gram.shape[0]
+    allowed = np.ones(n_atom, dtype=bool) if exclude is None else ~exclude
+    max_features = allowed.sum()
+    if tol is None:
+        max_features = min(n_nonzero_coefs, max_features)
+    min_float = np.finfo(gram.dtype).eps
+    coef = np.zeros(n_atom)
+    L = np.zeros((max_features, max_features))
+    active = []
+    alpha = Xy.copy()
+    gamma = np.zeros(0)
+    while len(active) < max_features:
+        score = np.where(allowed, np.abs(alpha), -1.)
+        lam = np.argmax(score)
+        if score[lam] ** 2 < min_float:
+            # inner product too small
+            break
+        n_active = len(active)
+        if n_active > 0:
+            row = solve_triangular(L[:n_active, :n_active], gram[lam, active], lower=True, check_finite=False)
+            Lkk = gram[lam, lam] - np.dot(row, row)
+            if Lkk <= min_float:
+                # selected atoms are dependent
+                break
+            L[n_active, :n_active] = row
+            L[n_active, n_active] = np.sqrt(Lkk)
+        else:
+            L[0, 0] = np.sqrt(gram[lam, lam])
+        active.append(lam)
+        allowed[lam] = False
+        n_active += 1
+        gamma = cho_solve((L[:n_active, :n_active], True), Xy[active], check_finite=False)
+        alpha = Xy - np.dot(gram[:, active], gamma)
+        if tol is not None and abs(norm_sq - np.dot(gamma, Xy[active])) <= tol:
+            break
+    coef[active] = gamma
+    return coef
+
+
+def omp_self_expression(gram, n_nonzero_coefs=None, tol=None, n_jobs=1):
+    """
+    OMP self-expression of every band by all the other bands, computed from one Gram matrix.
+    The preprocessing follows OrthogonalMatchingPursuit(fit_intercept=True, normalize=True):
+    pass the centered Gram matrix, atoms are scaled to unit norm and the coefficients scaled back.
+    Columns are solved on a thread pool of n_jobs workers.
+    :param gram: centered X^T X, shape (n_band, n_band), see Toolbox.streaming.gram_matrix(..., center=True)
+    :param n_nonzero_coefs: default 10% of the bands as in sklearn
+    :param tol: maximum squared residual norm, overrides n_nonzero_coefs
+    :param n_jobs:
+    :return: C with zero diagonal and columns scaled by their largest magnitude, shape (n_band, n_band)
+    """
+    n_band = gram.shape[0]
+    if n_nonzero_coefs is None:
+        n_nonzero_coefs = max(int(0.1 * n_band), 1)
+    scale = np.sqrt(np.diag(gram))
+    scale[scale == 0] = 1.
+    gram_normalized = gram / np.outer(scale, scale)
+    C = np.zeros((n_band, n_band))
+
+    def solve(columns):
+        exclude = np.zeros(n_band, dtype=bool)
+        for i in columns:
+            exclude[i] = True
+            coef = gram_omp(gram_normalized, gram[:, i] / scale, gram[i, i], n_nonzero_coefs, tol, exclude)
+            C[:, i] = coef / scale
+            exclude[i] = False
+
+    if n_jobs == 1:
+        solve(range(n_band))
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            list(pool.map(solve, np.array_split(np.arange(n_band), n_jobs)))
+    #  Normalize the columns of C: ci = ci / ||ci||_ss.
+    C /= np.max(np.abs(C), axis=0).reshape(1, -1)
+    return C
+
+
+def lasso_duality_gap(gram, C, mu):
+    """
+    duality gap of every column of C for  min_w 0.5*||X_{-i} w - x_i||^2 + mu*||w||_1, from the Gram matrix;
+    the dual point is the residual scaled into the feasible set ||X_{-i}^T theta||_inf <= mu
+    :param gram: X^T X
+    :param C: coefficients with zero diagonal
+    :param mu:
+    :return: primal objective and duality gap of every column
+    """
+    GC = np.dot(gram, C)
+    xr = np.diag(gram) - np.diag(GC)  # x_i^T r_i
+    rr = np.maximum(np.diag(gram) - 2 * np.diag(GC) + np.sum(C * GC, axis=0), 0)  # ||r_i||^2
+    correlation = gram - GC
+    np.fill_diagonal(correlation, 0)
+    scale = np.minimum(1., mu / np.maximum(np.abs(correlation).max(axis=0), np.finfo(np.float64).tiny))
+    primal = 0.5 * rr + mu * np.abs(C).sum(axis=0)
+    dual = scale * xr - 0.5 * scale ** 2 * rr
+    return primal, primal - dual
+
+
+def l1_self_expression(gram, lambda_coef, max_iter=1000, tol=1e-6):
+    """
+    solve  min_C 0.5*||X - XC||_F^2 + 0.5*lambda*||C||_1  s.t. diag(C) = 0, column by column as the per-band
+    problem  min_w 0.5*||X_{-i} w - x_i||^2 + 0.5*lambda*||w||_1  (the cvxpy model of SSC_BS), by the LARS-Lasso
+    homotopy on the Gram matrix. The path is exact after a finite number of steps, so unlike first-order
+    methods it does not stall on the strongly correlated bands of hyperspectral data.
+    :param gram: X^T X, shape (n_band, n_band)
+    :param lambda_coef: lambda
+    :param max_iter: maximum number of homotopy steps per band
+    :param tol: a warning is raised for the bands whose duality gap exceeds tol times their objective
+    :return: C (not normalized), relative duality gap of every band
+    """
+    import warnings
+    from sklearn.exceptions import ConvergenceWarning
+    from sklearn.linear_model import lars_path_gram
+    n_band = gram.shape[0]
+    mu = 0.5 * lambda_coef
+    C = np.zeros((n_band, n_band))
+    for i in range(n_band):
+        keep = np.arange(n_band) != i
+        # n_samples=1 keeps alpha in the unscaled units of the objective above
+        _, _, coefs = lars_path_gram(gram[keep, i], gram[np.ix_(keep, keep)], n_samples=1, alpha_min=mu,
+                                     method='lasso', max_iter=max_iter)
+        C[keep, i] = coefs[:, -1]
+    primal, gap = lasso_duality_gap(gram, C, mu)
+    gap = gap / np.maximum(primal, np.finfo(np.float64).tiny)
+    if np.any(gap > tol):
+        warnings.warn('l1_self_expression: relative duality gap %.2e > tol for %d bands, increase max_iter'
+                      % (gap.max(), np.sum(gap > tol)), ConvergenceWarning)
+    return C, gap
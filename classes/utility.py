@@ -9,22 +9,193 @@ from sklearn.model_selection import cross_val_score, train_test_split
 from sklearn.preprocessing import maxabs_scale
 from sklearn.metrics import accuracy_score
 from sklearn.model_selection import cross_val_score, StratifiedKFold, cross_val_predict
+import hashlib
+import json
+import os
+import weakref
 import numpy as np
-import copy
+from collections import OrderedDict
 from numpy import linalg
 from scipy.special import expit
 from sklearn.base import BaseEstimator, ClassifierMixin
+from Toolbox.streaming import iter_blocks, array_digest
 
 
-def eval_band(new_img, gt, train_inx, test_idx):
+def select_band_index(cluster_result, X=None, gram=None, chunk_size=None):
+    """
+    index of the band closest to the center of its cluster, one per cluster in the order of np.unique(cluster_result)
+    :param cluster_result: cluster label of each band
+    :param X: shape [n_pixel, n_band]; array, np.memmap or iterable of pixel blocks, read once in chunks
+    :param gram: X^T X instead of X, then ||x_j - m_c||^2 = G_jj - 2 * mean_{k in c} G_jk + mean_{k, l in c} G_kl
+    :param chunk_size:
+    :return: band indices, e.g. for a column view X[:, index] or a band-subset read
+    """
+    clusters, label, counts = np.unique(np.asarray(cluster_result), return_inverse=True, return_counts=True)
+    label = label.reshape(-1)
+    n_band = label.shape[0]
+    # column c averages the bands of cluster c
+    membership = np.zeros((n_band, clusters.shape[0]))
+    membership[np.arange(n_band), label] = 1. / counts[label]
+    if gram is not None:
+        gram_membership = np.dot(gram, membership)
+        center_norm = np.sum(membership * gram_membership, axis=0)
+        distance = np.diag(gram) - 2 * gram_membership[np.arange(n_band), label] + center_norm[label]
+    else:
+        distance = np.zeros(n_band)
+        for block in iter_blocks(X, chunk_size):
+            block = np.asarray(block, dtype=np.float64)
+            center = np.dot(block, membership)
+            distance += np.sum((block - center[:, label]) ** 2, axis=0)
+    # smallest distance inside each cluster, ties resolved by the lower band index
+    order = np.lexsort((distance, label))
+    first = np.concatenate(([0], np.nonzero(np.diff(label[order]))[0] + 1))
+    return order[first]
+
+
+def spectral_clustering_sweep(affinity, n_clusters, assign_labels='kmeans', eigen_solver=None, n_init=10,
+                              random_state=None):
+    """
+    SpectralClustering(n_clusters=k, affinity='precomputed') for every k in n_clusters from one embedding:
+    the eigenvectors of the normalized Laplacian are computed once for the largest k, and the embedding of
+    a smaller k is made of its first k columns, so only the label assignment is run per k
+    :param affinity: shape [n_band, n_band], symmetric and non-negative
+    :param n_clusters: list of numbers of clusters
+    :param assign_labels: 'kmeans' or 'discretize', as in SpectralClustering
+    :param eigen_solver: None, 'arpack', 'lobpcg' or 'amg'
+    :param n_init: k-means restarts
+    :param random_state:
+    :return: list of cluster labels, in the order of n_clusters
+    """
+    from sklearn.manifold import spectral_embedding
+    from sklearn.cluster import k_means
+    from sklearn.cluster.spectral import discretize
+    from sklearn.utils import check_random_state
+    random_state = check_random_state(random_state)
+    maps = spectral_embedding(affinity, n_components=max(n_clusters), eigen_solver=eigen_solver,
+                              random_state=random_state, drop_first=False)
+    labels = []
+    for k in n_clusters:
+        if assign_labels == 'kmeans':
+            labels.append(k_means(maps[:, :k], k, random_state=random_state, n_init=n_init)[1])
+        else:
+            labels.append(discretize(maps[:, :k], random_state=random_state))
+    return labels
+
+
+class EvalMemo(object):
+    """
+    persistent memo of evaluation scores, one .npy file per key in memo_dir; the key combines the dataset hash,
+    the sorted band set, the classifier configuration and the split, so equal band sets are evaluated once
+    """
+    def __init__(self, memo_dir=None):
+        """
+        :param memo_dir: default ./cache/eval in the working directory
+        """
+        if memo_dir is None:
+            memo_dir = os.getcwd() + '/cache/eval'
+        self.memo_dir = memo_dir
+        self.digests = {}
+
+    def dataset_digest(self, X, y):
+        """
+        content hash of (X, y), remembered for the arrays of the current process through weak references,
+        so the memo does not keep the cubes of a sweep in memory
+        """
+        key = (id(X), id(y))
+        entry = self.digests.get(key)
+        if entry is not None and entry[0]() is X and entry[1]() is y:
+            return entry[2]
+        digest = array_digest(X) + array_digest(np.asarray(y))
+        # drop the entries of arrays that no longer exist, their ids may be reused
+        self.digests = dict((k, v) for k, v in self.digests.items() if v[0]() is not None and v[1]() is not None)
+        try:
+            self.digests[key] = (weakref.ref(X), weakref.ref(y), digest)
+        except TypeError:
+            # e.g. a list of labels, hashed again on every call
+            pass
+        return digest
+
+    def key(self, X, y, band_index, **config):
+        description = json.dumps({'data': self.dataset_digest(X, y), 'bands': [int(b) for b in band_index],
+                                  'config': config}, sort_keys=True, default=self.__builtin)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def __builtin(value):
+        """
+        numpy scalars and arrays in the configuration, e.g. seeds from np.arange or rng.randint, as Python values,
+        so np.int64(3) and 3 give the same key
+        """
+        if isinstance(value, (np.generic, np.ndarray)):
+            return value.tolist()
+        raise TypeError('%r is not JSON serializable' % (value,))
+
+    def get(self, key):
+        path = os.path.join(self.memo_dir, key + '.npy')
+        return np.load(path) if os.path.exists(path) else None
+
+    def put(self, key, value):
+        if not os.path.exists(self.memo_dir):
+            os.makedirs(self.memo_dir)
+        path = os.path.join(self.memo_dir, key + '.npy')
+        np.save(path + '.tmp.npy', np.asarray(value))
+        os.replace(path + '.tmp.npy', path)
+
+
+class RankingSelector(object):
+    """
+    base of the selectors that rank all the bands at once (SPEC, Laplacian score, NDFS): fit keeps the full
+    ranking in ranking_, band_index returns the first bands for any number of bands without fitting again;
+    subclasses implement _rank(X)
+    """
+    def fit(self, X):
+        self.X = X
+        self.ranking_ = np.asarray(self._rank(X))
+        return self
+
+    def band_index(self, n_band=None):
+        """
+        :param n_band: number of bands or list of numbers of bands, default self.n_band
+        :return: indices of the best bands, a list of them for a list of numbers
+        """
+        if n_band is None:
+            n_band = self.n_band
+        if np.ndim(n_band) > 0:
+            return [self.ranking_[:k] for k in n_band]
+        return self.ranking_[:n_band]
+
+    def predict(self, X):
+        """
+        :param X: shape [n_row*n_clm, n_band]
+        :return: the n_band best bands of X, ranked on X (the ranking of fit is reused for the same X)
+        """
+        if getattr(self, 'ranking_', None) is None or X is not self.X:
+            self.fit(X)
+        # obtain the dataset on the selected features
+        return X[:, self.band_index()]
+
+
+def eval_band(new_img, gt, train_inx, test_idx, band_index=None, memo=None):
     """
 
-    :param new_img:
+    :param new_img: selected bands, or all bands when band_index is given
     :param gt:
     :param train_inx:
     :param test_idx:
+    :param band_index: bands of new_img to evaluate, used in sorted order
+    :param memo: EvalMemo, used together with band_index
     :return:
     """
+    key = None
+    if band_index is not None:
+        band_index = np.unique(band_index)
+        if memo is not None:
+            key = memo.key(new_img, gt, band_index, eval='knn5-maxabs', train=array_digest(np.asarray(train_inx)),
+                           test=array_digest(np.asarray(test_idx)))
+            score = memo.get(key)
+            if score is not None:
+                return float(score)
+        new_img = new_img[:, band_index]
     p = Processor()
     # img_, gt_ = p.get_correct(new_img, gt)
     gt_ = gt
@@ -37,34 +208,232 @@ def eval_band(new_img, gt, train_inx, test_idx):
     y_pre = knn_classifier.predict(X_test)
     score = accuracy_score(y_test, y_pre)
     # score = np.mean(score)
+    if key is not None:
+        memo.put(key, score)
     return score
 
 
-def eval_band_cv(X, y, times=10):
+def make_estimator(c, random_state=None):
+    """
+    classifiers of eval_band_cv
+    :param c: 0 knn, 1 svm, 2 elm
+    :param random_state: seed of the ELM hidden layer; SVC draws its libsvm seed even without probability
+            estimates, from the global numpy random state when random_state is None
+    :return:
+    """
+    if c == 0:
+        return KNN(n_neighbors=5)
+    if c == 1:
+        return SVC(C=1e4, kernel='rbf', gamma=1., random_state=random_state)
+    return ELM_Classifier(200, random_state=random_state)
+
+
+_SHARED = {}
+
+
+def _attach_shared(descriptions):
+    """
+    process pool initializer: map the shared arrays of eval_band_cv once per worker
+    """
+    from multiprocessing import shared_memory
+    for key, (name, shape, dtype) in descriptions.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _SHARED[key] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def _fit_predict(job, X=None, y=None):
+    """
+    one (repeat, fold, classifier) job of eval_band_cv, seeded so that serial and parallel runs agree
+    :param job: classifier, train index, test index, seed
+    :param X: None in a pool worker, then the shared arrays are used
+    :param y:
+    :return: predicted labels of the test pixels
+    """
+    c, train_index, test_index, seed = job
+    if X is None:
+        X, y = _SHARED['X'][1], _SHARED['y'][1]
+    # the seed goes to the estimator, the global numpy random state of the caller is left alone
+    estimator = make_estimator(c, random_state=seed)
+    estimator.fit(X[train_index], y[train_index])
+    return estimator.predict(X[test_index])
+
+
+def eval_band_cv(X, y, times=10, n_jobs=1, random_state=None, band_index=None, memo=None):
     """
-    :param X:
+    :param X: selected bands, or all bands when band_index is given
     :param y:
     :param times: n times k-fold cv
+    :param n_jobs: number of processes, the (repeat, fold, classifier) jobs share X and y through shared memory
+    :param random_state: seed of the splits and of the classifiers, None for a random run;
+            the scores of a seeded run do not depend on n_jobs
+    :param band_index: bands of X to evaluate, used in sorted order so that equal band sets give equal scores
+    :param memo: EvalMemo, used together with band_index and an integer random_state
     :return:  knn/svm/elm=>(OA+std, Kappa+std)
     """
+    key = None
+    if band_index is not None:
+        band_index = np.unique(band_index)
+        if memo is not None and random_state is not None:
+            key = memo.key(X, y, band_index, times=times, n_splits=3, random_state=random_state,
+                           estimator=[repr(sorted(make_estimator(c).get_params().items())) for c in range(3)])
+            score = memo.get(key)
+            if score is not None:
+                return [[oa, kappa] for oa, kappa in score]
+        X = X[:, band_index]
     p = Processor()
-    img_ = maxabs_scale(X)
-    estimator = [KNN(n_neighbors=5), SVC(C=1e4, kernel='rbf', gamma=1.), ELM_Classifier(200)]
-    estimator_pre, y_test_all = [[], [], []], []
+    rng = np.random.RandomState(random_state)
+    jobs, y_test_all = [], []
     for i in range(times):  # repeat N times K-fold CV
-        skf = StratifiedKFold(n_splits=3, shuffle=True)
-        for train_index, test_index in skf.split(img_, y):
-            X_train, X_test = X[train_index], X[test_index]
-            y_train, y_test = y[train_index], y[test_index]
-            y_test_all.append(y_test)
+        skf = StratifiedKFold(n_splits=3, shuffle=True, random_state=rng.randint(np.iinfo(np.int32).max))
+        # the folds only depend on the number of pixels and on y
+        for train_index, test_index in skf.split(X, y):
+            y_test_all.append(y[test_index])
             for c in range(3):
-                estimator[c].fit(X_train, y_train)
-                estimator_pre[c].append(estimator[c].predict(X_test))
+                jobs.append((c, train_index, test_index, rng.randint(np.iinfo(np.int32).max)))
+    if n_jobs == 1:
+        predictions = [_fit_predict(job, X, y) for job in jobs]
+    else:
+        predictions = _run_shared(jobs, X, y, n_jobs)
+    estimator_pre = [predictions[c::3] for c in range(3)]
     clf = ['knn', 'svm', 'elm']
     score = []
     for z in range(3):
         ca, oa, aa, kappa = p.save_res_4kfolds_cv(estimator_pre[z], y_test_all, file_name=clf[z] + 'score.npz', verbose=True)
         score.append([oa, kappa])
+    if key is not None:
+        memo.put(key, score)
+    return score
+
+
+def _run_shared(jobs, X, y, n_jobs):
+    """
+    run eval_band_cv jobs on a process pool, X and y are copied once into shared memory
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+    blocks, descriptions = [], {}
+    try:
+        for key, arr in (('X', np.ascontiguousarray(X)), ('y', np.ascontiguousarray(y))):
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            blocks.append(shm)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            descriptions[key] = (shm.name, arr.shape, arr.dtype)
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach_shared, initargs=(descriptions,)) as pool:
+            return list(pool.map(_fit_predict, jobs))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+class BandDistanceCache(object):
+    """
+    squared Euclidean distances from all pixels to a set of reference pixels for band subsets; squared distances
+    add up over bands, so the distances of a subset start from the largest cached subset it contains and only
+    the missing bands are added
+    """
+    def __init__(self, X, reference_index, max_entries=1, dtype='float32', chunk_size=4096):
+        """
+        :param X: shape [n_pixel, n_band]
+        :param reference_index: reference pixels, e.g. the training pixels of one fold
+        :param max_entries: number of subsets kept, each one takes n_pixel x n_reference floats; one is enough
+                for a sweep where every subset extends the previous one
+        :param dtype: dtype of the distances, float32 halves the memory of every entry
+        :param chunk_size: pixels whose distances to a new band are added at once
+        """
+        self.X = X
+        self.reference = X[reference_index]
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.cache = OrderedDict()
+
+    def distance(self, band_index):
+        """
+        :param band_index:
+        :return: squared distances, shape [n_pixel, n_reference]
+        """
+        subset = frozenset(int(b) for b in band_index)
+        if subset in self.cache:
+            self.cache.move_to_end(subset)
+            return self.cache[subset]
+        contained = [key for key in self.cache if key <= subset]
+        if contained:
+            base = max(contained, key=len)
+            if len(self.cache) >= self.max_entries and next(iter(self.cache)) == base:
+                # the base would be evicted right after, it is extended in place instead of copied
+                D = self.cache.pop(base)
+            else:
+                D = self.cache[base].copy()
+        else:
+            base = frozenset()
+            D = np.zeros((self.X.shape[0], self.reference.shape[0]), dtype=self.dtype)
+        for b in sorted(subset - base):
+            column, reference = self.X[:, b].astype(self.dtype), self.reference[:, b].astype(self.dtype)
+            for start in range(0, D.shape[0], self.chunk_size):
+                D[start:start + self.chunk_size] += \
+                    (column[start:start + self.chunk_size].reshape(-1, 1) - reference.reshape(1, -1)) ** 2
+        self.cache[subset] = D
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        return D
+
+    def kernel(self, band_index, gamma=1., out=None):
+        """
+        RBF kernel exp(-gamma * ||x - x'||^2) on the band subset
+        :param out: preallocated array of the shape of the distances, e.g. reused over a sweep
+        """
+        K = np.multiply(self.distance(band_index), -gamma, out=out)
+        return np.exp(K, out=K)
+
+
+def eval_band_sweep(X, y, band_subsets, times=1, random_state=None, max_entries=1, dtype='float32'):
+    """
+    eval_band_cv for many band subsets of the same pixels, e.g. the selections of a sweep over n_band;
+    KNN and SVC work on precomputed distances / kernels from a BandDistanceCache per fold, so a subset that
+    extends a previous one only costs its new bands. Splits and seeds are those of
+    eval_band_cv(X[:, subset], y, times, random_state=random_state) for every subset.
+    The pixels of a fold are ordered training first, so the training and test blocks of the distances are views;
+    the memory of a fold is about (max_entries + 1) * n_pixel * n_train floats of dtype.
+    :param X: shape [n_pixel, n_band], all bands
+    :param y:
+    :param band_subsets: list of band index lists
+    :param times: n times k-fold cv
+    :param random_state:
+    :param max_entries: see BandDistanceCache
+    :param dtype: see BandDistanceCache; float64 reproduces eval_band_cv exactly, with float32 the KNN and ELM
+            scores are the same and the SVC (C=1e4) may differ slightly from its float64 kernel
+    :return: for each subset knn/svm/elm=>(OA+std, Kappa+std)
+    """
+    p = Processor()
+    rng = np.random.RandomState(random_state)
+    n_subset = len(band_subsets)
+    estimator_pre, y_test_all = [[[], [], []] for _ in range(n_subset)], []
+    for i in range(times):  # repeat N times K-fold CV
+        skf = StratifiedKFold(n_splits=3, shuffle=True, random_state=rng.randint(np.iinfo(np.int32).max))
+        for train_index, test_index in skf.split(X, y):
+            y_test_all.append(y[test_index])
+            seeds = [rng.randint(np.iinfo(np.int32).max) for c in range(3)]
+            n_train = train_index.shape[0]
+            order = np.concatenate((train_index, test_index))
+            cache = BandDistanceCache(X[order], np.arange(n_train), max_entries=max_entries, dtype=dtype)
+            K = None
+            for s, subset in enumerate(band_subsets):
+                D = cache.distance(subset)
+                knn = KNN(n_neighbors=5, metric='precomputed').fit(D[:n_train], y[train_index])
+                estimator_pre[s][0].append(knn.predict(D[n_train:]))
+                K = cache.kernel(subset, out=K)
+                svm = SVC(C=1e4, kernel='precomputed').fit(K[:n_train], y[train_index])
+                estimator_pre[s][1].append(svm.predict(K[n_train:]))
+                estimator_pre[s][2].append(_fit_predict((2, train_index, test_index, seeds[2]),
+                                                        X[:, list(subset)], y))
+    score = []
+    for s in range(n_subset):
+        score_ = []
+        for z in range(3):
+            ca, oa, aa, kappa = p.save_res_4kfolds_cv(estimator_pre[s][z], y_test_all)
+            score_.append([oa, kappa])
+        score.append(score_)
     return score
 
 
@@ -72,13 +441,43 @@ class ELM_Classifier(BaseEstimator, ClassifierMixin):
     upper_bound = .5
     lower_bound = -.5
 
-    def __init__(self, n_hidden, dropout_prob=None):
+    def __init__(self, n_hidden, dropout_prob=None, alpha=None, n_estimators=1, dtype=np.float64,
+                 random_state=None, batch_size=None):
+        """
+        :param n_hidden: hidden nodes of each ELM
+        :param dropout_prob:
+        :param alpha: None for the least-squares solution by pinv, otherwise the output weights solve the ridge
+                normal equations (H^T H + alpha*I) B = H^T y on the n_hidden x n_hidden system
+        :param n_estimators: number of ELMs with different random hidden layers, stacked so that fit solves the
+                systems of all the ELMs in one batched call and predict averages their outputs in a single product
+        :param dtype: dtype of the hidden layer, np.float32 halves its memory; the systems are solved in float64
+        :param random_state: seed of the hidden layers, None uses the global numpy random state
+        :param batch_size: if given, fit streams X (e.g. a np.memmap) through partial_fit in blocks of batch_size
+                pixels, so the hidden layer matrix of the whole training set is never formed
+        """
         self.n_hidden = n_hidden
         self.dropout_prob = dropout_prob
+        self.alpha = alpha
+        self.n_estimators = n_estimators
+        self.dtype = dtype
+        self.random_state = random_state
+        self.batch_size = batch_size
 
     def fit(self, X, y, sample_weight=None):
+        # previous partial_fit statistics are dropped
+        self.__dict__.pop('R_', None)
+        if self.batch_size is not None:
+            classes = np.arange(y.shape[1]) if y.shape.__len__() == 2 else np.unique(y)
+            if sample_weight is not None:
+                # normalized over the whole set as below, partial_fit uses the weights as given
+                sample_weight = sample_weight / sample_weight.sum()
+            for start in range(0, X.shape[0], self.batch_size):
+                stop = start + self.batch_size
+                self.partial_fit(X[start:stop], y[start:stop], classes=classes,
+                                 sample_weight=None if sample_weight is None else sample_weight[start:stop])
+            self.sample_weight = sample_weight
+            return self
         # check label has form of 2-dim array
-        X, y, = copy.deepcopy(X), copy.deepcopy(y)
         self.sample_weight = None
         if y.shape.__len__() != 2:
             self.classes_ = np.unique(y)
@@ -87,49 +486,125 @@ class ELM_Classifier(BaseEstimator, ClassifierMixin):
         else:
             self.classes_ = np.arange(y.shape[1])
             self.n_classes_ = self.classes_.__len__()
-        self.W = np.random.uniform(self.lower_bound, self.upper_bound, size=(X.shape[1], self.n_hidden))
-        if self.dropout_prob is not None:
-            self.W = self.dropout(self.W, prob=self.dropout_prob)
-            # X = self.dropout(X, prob=self.dropout_prob)
-        self.b = np.random.uniform(self.lower_bound, self.upper_bound, size=self.n_hidden)
+        X = np.asarray(X, dtype=self.dtype)
+        self.__init_hidden(X.shape[1])
         H = expit(np.dot(X, self.W) + self.b)
         # H = self.dropout(H, prob=0.1)
+        # stack of the (n_sample, n_hidden) hidden layers of the ELMs, solved in float64 whatever self.dtype
+        H = self.__stack(H)
+        y = np.asarray(y, dtype=np.float64)
         if sample_weight is not None:
             self.sample_weight = sample_weight / sample_weight.sum()
-            extend_sample_weight = np.diag(self.sample_weight)
-            inv_ = linalg.pinv(np.dot(
-                np.dot(H.transpose(), extend_sample_weight), H))
-            self.B = np.dot(np.dot(np.dot(inv_, H.transpose()), extend_sample_weight), y)
+            # diag(sqrt(w)) H and diag(sqrt(w)) y by broadcasting
+            root = np.sqrt(self.sample_weight).reshape(-1, 1)
+            H, y = H * root, y * root
+        if self.alpha is None:
+            # least squares of every ELM by one batched pinv
+            B = np.matmul(linalg.pinv(H), y)
         else:
-            self.B = np.dot(linalg.pinv(H), y)
+            Ht = H.transpose(0, 2, 1)
+            B = self.__solve(np.matmul(Ht, H), np.matmul(Ht, y))
+        self.B = (B.reshape(-1, self.n_classes_) / self.n_estimators).astype(self.dtype)
         return self
 
+    def partial_fit(self, X, y, classes=None, sample_weight=None):
+        """
+        online sequential ELM: the hidden layer is drawn on the first call, every call folds the block into the
+        triangular factor R of [H | y] (QR update) and updates B, so pixel blocks can be streamed from a memmapped
+        cube. R^T R = [H | y]^T [H | y], but B is solved from R itself, so without alpha it is the pinv(H) y of fit
+        and the condition number of H is not squared; sample weights are used as given, without normalization
+        :param X: block of pixels
+        :param y: labels of the block, or 2-dim targets
+        :param classes: all the labels, needed on the first call unless every label is in the first block
+        :param sample_weight:
+        :return:
+        """
+        X = np.asarray(X, dtype=self.dtype)
+        if not hasattr(self, 'R_'):
+            self.sample_weight = None
+            if y.shape.__len__() != 2:
+                self.classes_ = np.unique(y) if classes is None else np.asarray(classes)
+            else:
+                self.classes_ = np.arange(y.shape[1])
+            self.n_classes_ = self.classes_.__len__()
+            self.__init_hidden(X.shape[1])
+            n = self.n_hidden + self.n_classes_
+            self.R_ = np.zeros((self.n_estimators, n, n))
+        if y.shape.__len__() != 2:
+            y = self.one2array(np.searchsorted(self.classes_, y), self.n_classes_)
+        H = self.__stack(expit(np.dot(X, self.W) + self.b))
+        y = np.broadcast_to(np.asarray(y, dtype=np.float64), (self.n_estimators,) + y.shape)
+        block = np.concatenate((H, y), axis=2)
+        if sample_weight is not None:
+            block = block * np.sqrt(np.asarray(sample_weight, dtype=np.float64)).reshape(1, -1, 1)
+        # R of [R; block] for all the ELMs in one batched QR
+        self.R_ = linalg.qr(np.concatenate((self.R_, block), axis=1), mode='r')
+        R_H, R_y = self.R_[:, :self.n_hidden, :self.n_hidden], self.R_[:, :self.n_hidden, self.n_hidden:]
+        if self.alpha is None:
+            B = np.matmul(linalg.pinv(R_H), R_y)
+        else:
+            R_Ht = R_H.transpose(0, 2, 1)
+            B = self.__solve(np.matmul(R_Ht, R_H), np.matmul(R_Ht, R_y))
+        self.B = (B.reshape(-1, self.n_classes_) / self.n_estimators).astype(self.dtype)
+        return self
+
+    def __init_hidden(self, n_features):
+        rng = np.random if self.random_state is None else np.random.RandomState(self.random_state)
+        n_hidden = self.n_hidden * self.n_estimators
+        self.W = rng.uniform(self.lower_bound, self.upper_bound, size=(n_features, n_hidden)).astype(self.dtype)
+        if self.dropout_prob is not None:
+            self.W = self.dropout(self.W, prob=self.dropout_prob, rng=rng)
+            # X = self.dropout(X, prob=self.dropout_prob)
+        self.b = rng.uniform(self.lower_bound, self.upper_bound, size=n_hidden).astype(self.dtype)
+
+    def __stack(self, H):
+        """
+        :param H: hidden layer of all the ELMs, shape (n_sample, n_estimators * n_hidden)
+        :return: float64 stack of shape (n_estimators, n_sample, n_hidden)
+        """
+        H = np.asarray(H, dtype=np.float64)
+        return H.reshape(H.shape[0], self.n_estimators, self.n_hidden).transpose(1, 0, 2)
+
+    def __solve(self, gram, Hty):
+        """
+        output weights of all the ELMs from the stacks of H^T W H and H^T W y, pinv without alpha; with alpha the
+        ridge systems of all the ELMs are solved by one batched call
+        :param gram: shape (n_estimators, n_hidden, n_hidden)
+        :param Hty: shape (n_estimators, n_hidden, n_classes)
+        :return: shape (n_estimators, n_hidden, n_classes)
+        """
+        gram, Hty = np.asarray(gram, dtype=np.float64), np.asarray(Hty, dtype=np.float64)
+        if self.alpha is None:
+            return np.matmul(linalg.pinv(gram), Hty)
+        return linalg.solve(gram + self.alpha * np.eye(self.n_hidden), Hty)
+
     def one2array(self, y, n_dim):
         y_expected = np.zeros((y.shape[0], n_dim))
-        for i in range(y.shape[0]):
-            y_expected[i][y[i]] = 1
+        y_expected[np.arange(y.shape[0]), y] = 1
         return y_expected
 
     def predict(self, X, prob=False):
-        X = copy.deepcopy(X)
-        H = expit(np.dot(X, self.W) + self.b)
+        H = expit(np.dot(np.asarray(X, dtype=self.dtype), self.W) + self.b)
         output = np.dot(H, self.B)
         if prob:
             return output
-        return output.argmax(axis=1)
+        # fit expects labels 0..k-1 (one2array), partial_fit maps any labels through classes_
+        return self.classes_[output.argmax(axis=1)]
 
     def get_params(self, deep=True):
-        params = {'n_hidden': self.n_hidden, 'dropout_prob': self.dropout_prob}
+        params = {'n_hidden': self.n_hidden, 'dropout_prob': self.dropout_prob, 'alpha': self.alpha,
+                  'n_estimators': self.n_estimators, 'dtype': self.dtype, 'random_state': self.random_state,
+                  'batch_size': self.batch_size}
         return params
 
     def set_params(self, **parameters):
         return self
 
-    def dropout(self, x, prob=0.2):
+    def dropout(self, x, prob=0.2, rng=np.random):
         if prob < 0. or prob >= 1:
             raise Exception('Dropout level must be in interval [0, 1]')
         retain_prob = 1. - prob
-        sample = np.random.binomial(n=1, p=retain_prob, size=x.shape)
+        sample = rng.binomial(n=1, p=retain_prob, size=x.shape)
         x *= sample
         # x /= retain_prob
         return x
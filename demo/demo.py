@@ -1,6 +1,5 @@
 from classes.SpaBS import SpaBS
 from Toolbox.Preprocessing import Processor
-from sklearn.preprocessing import minmax_scale
 from classes.DSC_NET import DSC_NET
 import numpy as np
 from classes.DSC_NET import DSCBS
@@ -27,13 +26,12 @@ if __name__ == '__main__':
     print(img_path)
 
     p = Processor()
-    img, gt = p.prepare_data(img_path, gt_path)
-    # Img, Label = Img[:256, :, :], Label[:256, :]
-    n_row, n_column, n_band = img.shape
-    X_img = minmax_scale(img.reshape(n_row * n_column, n_band)).reshape((n_row, n_column, n_band))
-    img_correct, gt_correct = p.get_correct(X_img, gt)
-    gt_correct = p.standardize_label(gt_correct)
+    # min-max scaled cube, ground truth and labeled-pixel index, cached on disk after the first run
+    X_img, gt, labeled_index = p.load_normalized(img_path, gt_path)
+    n_row, n_column, n_band = X_img.shape
     X_img_2D = X_img.reshape(n_row * n_column, n_band)
+    img_correct, gt_correct = X_img_2D[labeled_index], gt.reshape(-1)[labeled_index]
+    gt_correct = p.standardize_label(gt_correct)
     train_inx, test_idx = p.get_tr_tx_index(gt_correct, test_size=0.4)
 
     n_input = [n_row, n_column]
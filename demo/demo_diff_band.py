@@ -1,10 +1,9 @@
 from Toolbox.Preprocessing import Processor
-from sklearn.preprocessing import minmax_scale
 #from classes.DSC_NET import DSC_NET
 import numpy as np
 #from classes.DSC_NET import DSCBS
 from classes.SPEC import SPEC_HSI
-from classes.utility import eval_band, eval_band_cv
+from classes.utility import eval_band, eval_band_cv, eval_band_sweep
 from classes.SNMF import BandSelection_SNMF
 from classes.Lap_score import Lap_score_HSI
 from classes.NDFS import NDFS_HSI
@@ -25,12 +24,11 @@ if __name__ == '__main__':
     print(img_path)
 
     p = Processor()
-    img, gt = p.prepare_data(img_path, gt_path)
-    # Img, Label = Img[:256, :, :], Label[:256, :]
-    n_row, n_column, n_band = img.shape
-    X_img = minmax_scale(img.reshape(n_row * n_column, n_band)).reshape((n_row, n_column, n_band))
+    # min-max scaled cube, ground truth and labeled-pixel index, cached on disk after the first run
+    X_img, gt, labeled_index = p.load_normalized(img_path, gt_path)
+    n_row, n_column, n_band = X_img.shape
     X_img_2D = X_img.reshape(n_row * n_column, n_band)
-    img_correct, gt_correct = p.get_correct(X_img, gt)
+    img_correct, gt_correct = X_img_2D[labeled_index], gt.reshape(-1)[labeled_index]
     gt_correct = p.standardize_label(gt_correct)
     train_inx, test_idx = p.get_tr_tx_index(gt_correct, test_size=0.4)
 
@@ -59,35 +57,31 @@ if __name__ == '__main__':
               'logs_path': logs_path}
 
     # algorithm = [DSCBS(n_selected_band, **kwargs)]
-    alg_key = ['SPEC', 'Lap_score', 'NDFS', 'SpaBS', 'ISSC', 'SNMF'] #,'DSC']
+    alg_key = ['SPEC', 'Lap_score', 'ISSC'] #, 'NDFS', 'SpaBS', 'SNMF','DSC']
     num_band = np.arange(5, 55, 5)
     knn_res, svm_res, elm_res = [], [], []
-    for n_selected_band in num_band:
-        algorithm = [SPEC_HSI(n_selected_band),
-                     Lap_score_HSI(n_selected_band),
-                     #NDFS_HSI(np.unique(gt_correct).shape[0], n_selected_band),
-                     #SpaBS(n_selected_band),
-                     ISSC_HSI(n_selected_band, coef_=1.e-4)]#,  #
-                     #BandSelection_SNMF(n_selected_band)]
-                     
-                     #,DSCBS(n_selected_band, **kwargs)]
+    # the ranking selectors are fitted once, band_index gives the selection of every n_band
+    spec, lap = SPEC_HSI().fit(X_img_2D), Lap_score_HSI().fit(X_img_2D)
+    # ISSC clusters the bands for every n_band from one affinity matrix and spectral embedding
+    issc = ISSC_HSI(coef_=1.e-4)
+    band_subsets = [spec.band_index(num_band),
+                    lap.band_index(num_band),
+                    #NDFS_HSI(np.unique(gt_correct).shape[0]).fit(X_img_2D).band_index(num_band),
+                    issc.predict_sweep(X_img_2D, num_band)]
+                    #,DSCBS(n_selected_band, **kwargs)]
+    # every algorithm is evaluated on all its subsets at once, the distances of KNN / SVC are extended band by
+    # band; splits and seeds are those of eval_band_cv(img_correct[:, subset], gt_correct, times=1, random_state=0)
+    sweep_score = [eval_band_sweep(img_correct, gt_correct, subsets, times=1, random_state=0)
+                   for subsets in band_subsets]
+    for n, n_selected_band in enumerate(num_band):
         knn_score, svm_score, elm_score = [], [], []
-        for i in range(algorithm.__len__()):
-            if i <= 4:
-                X_new = algorithm[i].predict(X_img_2D)
-                X_new, _ = p.get_correct(X_new.reshape(n_row, n_column, n_selected_band), gt)
-            else:
-                X_new = algorithm[i].predict(X_img)
-                X_new, _ = p.get_correct(X_new, gt)
-            knn_oa_kappa, svm_oa_kappa, elm_oa_kappa = eval_band_cv(X_new, gt_correct, times=1)
+        for i in range(band_subsets.__len__()):
+            knn_oa_kappa, svm_oa_kappa, elm_oa_kappa = sweep_score[i][n]
             knn_score.append(knn_oa_kappa), svm_score.append(svm_oa_kappa), elm_score.append(elm_oa_kappa)
             print('n_band:%s, alg:%s\nknn: %s\nsvm: %s\nelm: %s' %
                   (n_selected_band, alg_key[i], knn_oa_kappa, svm_oa_kappa, elm_oa_kappa))
         knn_res.append(knn_score), svm_res.append(svm_score), elm_res.append(elm_score)
         print('-----------------------------------------')
-        if n_selected_band % 10 == 0:
-            np.savez('./score-indian.npz', knn_score=np.asarray(knn_res),
-                     svm_score=np.asarray(svm_res), elm_score=np.asarray(elm_res))
     np.savez('./score-indian.npz', knn_score=np.asarray(knn_res),
              svm_score=np.asarray(svm_res), elm_score=np.asarray(elm_res))
 
@@ -1,7 +1,6 @@
 # coding:utf-8
 from classes.utility import eval_band_cv
 from Toolbox.Preprocessing import Processor
-from sklearn.preprocessing import minmax_scale
 from sklearn.metrics import accuracy_score
 from classes.SNMF import BandSelection_SNMF
 import numpy as np
@@ -19,11 +18,10 @@ if __name__ == '__main__':
 
 
     p = Processor()
-    img, gt = p.prepare_data(img_path, gt_path)
+    # min-max scaled cube, cached on disk after the first run
+    img, gt, labeled_index = p.load_normalized(img_path, gt_path)
     n_row, n_column, n_band = img.shape
-    train_inx, test_idx = p.get_tr_tx_index(p.get_correct(img, gt)[1], test_size=0.9)
-
-    img = minmax_scale(img.reshape(n_row * n_column, n_band)).reshape((n_row, n_column, n_band))
+    train_inx, test_idx = p.get_tr_tx_index(gt.reshape(-1)[labeled_index], test_size=0.9)
 
     x_input = img.reshape(n_row*n_column, n_band)
 
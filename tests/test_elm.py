@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from classes.utility import ELM_Classifier
+
+
+@pytest.mark.parametrize('alpha', [None, 1e-2])
+def test_weighted_batched_fit_matches_full_fit(alpha):
+    rng = np.random.RandomState(0)
+    X = rng.rand(300, 5)
+    y = rng.randint(0, 3, 300)
+    sample_weight = rng.rand(300) * 10
+    full = ELM_Classifier(20, alpha=alpha, random_state=0).fit(X, y, sample_weight=sample_weight)
+    batched = ELM_Classifier(20, alpha=alpha, random_state=0, batch_size=64).fit(X, y, sample_weight=sample_weight)
+    assert np.allclose(batched.sample_weight, full.sample_weight)
+    assert np.allclose(batched.B, full.B, atol=1e-6 * np.abs(full.B).max())
+    assert np.array_equal(batched.predict(X), full.predict(X))
+
+
+def ill_conditioned_data(n_sample=6000, n_band=5):
+    # few bands and many hidden nodes, as in eval_band_cv: cond(H) is about 1e8
+    rng = np.random.RandomState(0)
+    X = rng.rand(n_sample, n_band)
+    y = (3 * X[:, 0] + 2 * X[:, 1] > 2.5).astype(int) + (X[:, 2] > 0.5)
+    return X, y
+
+
+def test_float32_hidden_layer_is_solved_in_float64():
+    X, y = ill_conditioned_data()
+    full = ELM_Classifier(200, random_state=0).fit(X, y)
+    half = ELM_Classifier(200, random_state=0, dtype=np.float32).fit(X, y)
+    assert half.B.dtype == np.float32
+    assert np.mean(half.predict(X) != full.predict(X)) < 0.02
+
+
+@pytest.mark.parametrize('alpha', [None, 1e-3])
+def test_stacked_estimators_match_separate_solves(alpha):
+    X, y = ill_conditioned_data(1000)
+    elm = ELM_Classifier(30, alpha=alpha, n_estimators=3, random_state=0).fit(X, y)
+    H = 1. / (1. + np.exp(-(np.dot(X, elm.W) + elm.b)))
+    Y = np.eye(3)[y]
+    B = []
+    for e in range(3):
+        H_e = H[:, e * 30:(e + 1) * 30]
+        if alpha is None:
+            B.append(np.dot(np.linalg.pinv(H_e), Y))
+        else:
+            B.append(np.linalg.solve(np.dot(H_e.T, H_e) + alpha * np.eye(30), np.dot(H_e.T, Y)))
+    assert np.allclose(elm.B, np.concatenate(B) / 3, rtol=1e-6, atol=1e-6 * np.abs(elm.B).max())
+
+
+@pytest.mark.parametrize('n_band', [5, 3])
+def test_batched_least_squares_fit_matches_full_fit(n_band):
+    # alpha=None: the online QR update must give pinv(H) y, not pinv(H^T H) H^T y
+    X, y = ill_conditioned_data(n_band=n_band)
+    full = ELM_Classifier(200, random_state=0).fit(X, y)
+    batched = ELM_Classifier(200, random_state=0, batch_size=1000).fit(X, y)
+    assert np.mean(batched.predict(X) != full.predict(X)) < 0.001
+    assert np.mean(batched.predict(X) == y) >= np.mean(full.predict(X) == y) - 0.001
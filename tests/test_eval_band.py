@@ -0,0 +1,69 @@
+import numpy as np
+
+from classes.utility import eval_band_cv
+
+
+def make_data():
+    rng = np.random.RandomState(0)
+    y = np.repeat(np.arange(3), 30)
+    X = rng.rand(90, 4) + y.reshape(-1, 1)
+    return X, y
+
+
+def test_eval_band_cv_leaves_global_random_state_alone(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    X, y = make_data()
+    np.random.seed(123)
+    expected = np.random.rand(3)
+    np.random.seed(123)
+    eval_band_cv(X, y, times=1, random_state=0)
+    assert np.array_equal(np.random.rand(3), expected)
+
+
+def test_eval_band_cv_serial_and_parallel_agree(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    X, y = make_data()
+    serial = eval_band_cv(X, y, times=1, random_state=0)
+    np.random.seed(1)
+    assert np.allclose(serial, eval_band_cv(X, y, times=1, random_state=0))
+    assert np.allclose(serial, eval_band_cv(X, y, times=1, n_jobs=2, random_state=0))
+
+
+def test_eval_memo_does_not_keep_arrays_alive(tmp_path):
+    import weakref
+    from classes.utility import EvalMemo
+    memo = EvalMemo(str(tmp_path))
+    X, y = make_data()
+    digest = memo.dataset_digest(X, y)
+    assert memo.dataset_digest(X, y) == digest
+    assert memo.dataset_digest(X, list(y)) == digest
+    ref = weakref.ref(X)
+    del X
+    assert ref() is None
+
+
+def test_eval_band_sweep_matches_eval_band_cv(tmp_path, monkeypatch):
+    from classes.utility import eval_band_sweep
+    monkeypatch.chdir(tmp_path)
+    X, y = make_data()
+    X = np.hstack((X, np.random.RandomState(1).rand(X.shape[0], 4)))
+    subsets = [[0, 4], [0, 2, 4, 6], [0, 1, 2, 4, 6, 7]]
+    exact = eval_band_sweep(X, y, subsets, times=2, random_state=3, dtype='float64')
+    approx = eval_band_sweep(X, y, subsets, times=2, random_state=3)
+    for s, subset in enumerate(subsets):
+        expected = np.asarray(eval_band_cv(X[:, subset], y, times=2, random_state=3))
+        assert np.allclose(exact[s], expected)
+        # float32 distances: same knn and elm scores
+        assert np.allclose(np.asarray(approx[s])[[0, 2]], expected[[0, 2]])
+
+
+def test_eval_memo_accepts_numpy_integers(tmp_path, monkeypatch):
+    from classes.utility import EvalMemo
+    monkeypatch.chdir(tmp_path)
+    X, y = make_data()
+    memo = EvalMemo(str(tmp_path / 'memo'))
+    assert memo.key(X, y, [0, 1], times=np.int32(1), random_state=np.int64(3)) == \
+        memo.key(X, y, [0, 1], times=1, random_state=3)
+    score = eval_band_cv(X, y, times=1, random_state=np.int64(3), band_index=[0, 2], memo=memo)
+    assert np.allclose(eval_band_cv(X, y, times=1, random_state=3, band_index=[0, 2], memo=memo), score)
+    assert len(list((tmp_path / 'memo').iterdir())) == 1
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('skfeature')
+pytest.importorskip('sklearn.cluster.spectral')
+from classes.ISSC import ISSC_HSI
+
+
+def test_predict_accepts_generator_of_blocks():
+    rng = np.random.RandomState(0)
+    X = np.repeat(rng.rand(500, 4), 5, axis=1) + 0.01 * rng.rand(500, 20)
+    np.random.seed(0)
+    issc = ISSC_HSI(4, coef_=1e-4)
+    selected = issc.predict(X)
+    np.random.seed(0)
+    issc_stream = ISSC_HSI(4, coef_=1e-4)
+    band_index = issc_stream.predict(X[start:start + 64] for start in range(0, 500, 64))
+    assert np.array_equal(band_index, issc.band_index_)
+    assert np.array_equal(selected, X[:, band_index])
+    # one band per cluster, not simply the first band of each cluster
+    assert len(set(band_index)) == 4
@@ -0,0 +1,25 @@
+import numpy as np
+import scipy.sparse
+
+from classes.Lap_score import laplacian_score
+from Toolbox.knn_graph import knn_graph
+
+
+def dense_lap_score(X, W):
+    # skfeature.function.similarity_based.lap_score.lap_score on dense matrices
+    W = W.toarray()
+    d = W.sum(axis=1)
+    tmp = np.dot(d, X)
+    D_prime = np.sum(np.dot(X.T, np.diag(d)).T * X, 0) - tmp * tmp / d.sum()
+    L_prime = np.sum(np.dot(X.T, W).T * X, 0) - tmp * tmp / d.sum()
+    D_prime[D_prime < 1e-12] = 10000
+    return 1 - L_prime / D_prime
+
+
+def test_laplacian_score_matches_dense():
+    rng = np.random.RandomState(0)
+    X = rng.rand(300, 10)
+    X[:, 3] = 1.  # constant band, caught by the D' < 1e-12 guard
+    W = knn_graph(X, k=5, weight_mode='heat_kernel', t=1)
+    assert scipy.sparse.issparse(W)
+    assert np.allclose(laplacian_score(X, W), dense_lap_score(X, W))
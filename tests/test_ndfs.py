@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import scipy.sparse
+
+pytest.importorskip('skfeature')
+from classes.NDFS import ndfs
+
+
+def dense_ndfs(X, L, F, alpha=1, beta=1, gamma=1., n_iter=5):
+    # update rules of skfeature.function.sparse_learning_based.NDFS on a dense Laplacian
+    n_samples, n_features = X.shape
+    D = np.identity(n_features)
+    for _ in range(n_iter):
+        T = np.linalg.inv(np.dot(X.T, X) + beta * D + 1e-6 * np.eye(n_features))
+        Weight = np.dot(np.dot(T, X.T), F)
+        temp = np.sqrt((Weight * Weight).sum(1))
+        temp[temp < 1e-16] = 1e-16
+        D = np.diag(0.5 / temp)
+        M = L + alpha * (np.identity(n_samples) - np.dot(np.dot(X, T), X.T))
+        M = (M + M.T) / 2
+        F = F * (gamma * F) / (np.dot(M, F) + gamma * np.dot(np.dot(F, F.T), F))
+        F = np.dot(F, np.diag(np.sqrt(np.diag(1 / (np.dot(F.T, F) + 1e-16)))))
+    return Weight
+
+
+def test_ndfs_matches_dense_updates():
+    rng = np.random.RandomState(0)
+    X = rng.rand(60, 6)
+    W = (rng.rand(60, 60) < 0.1).astype(np.float64)
+    W = np.maximum(W, W.T)
+    F0 = rng.rand(60, 3) + 0.02
+    d = W.sum(1)
+    Weight, _ = ndfs(X, scipy.sparse.csr_matrix(W), F0=F0, gamma=1., max_iter=5, tol=0, laplacian='graph')
+    assert np.allclose(Weight, dense_ndfs(X, np.diag(d) - W, F0))
+    # the default follows skfeature, np.array(W.sum(1))[:, 0] - W, i.e. L[i, j] = d[j] - W[i, j]
+    Weight, _ = ndfs(X, scipy.sparse.csr_matrix(W), F0=F0, gamma=1., max_iter=5, tol=0)
+    assert np.allclose(Weight, dense_ndfs(X, d - W, F0))
+    assert not np.allclose(Weight, dense_ndfs(X, np.diag(d) - W, F0))
@@ -0,0 +1,49 @@
+import warnings
+
+import numpy as np
+import pytest
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.linear_model import Lasso
+
+from classes.self_expression import l1_self_expression, lasso_duality_gap
+
+
+def correlated_bands(n_pixel=2000, n_band=30, rank=6):
+    # hyperspectral-like: a few endmembers mixed into many strongly correlated bands
+    rng = np.random.RandomState(0)
+    return np.dot(rng.rand(n_pixel, rank), rng.rand(rank, n_band)) + 0.01 * rng.rand(n_pixel, n_band)
+
+
+@pytest.mark.parametrize('lambda_coef', [0.1, 1., 100.])
+def test_l1_self_expression_reaches_per_band_optimum(lambda_coef):
+    X = correlated_bands()
+    gram = np.dot(X.T, X)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', ConvergenceWarning)
+        C, gap = l1_self_expression(gram, lambda_coef)
+    assert np.all(np.diag(C) == 0)
+    # the duality gap certifies the optimum of every per-band problem (the cvxpy model)
+    primal, gap_ = lasso_duality_gap(gram, C, 0.5 * lambda_coef)
+    assert np.all(gap_ <= 1e-6 * primal)
+    for i in range(0, X.shape[1], 5):
+        X_i = np.delete(X, i, axis=1)
+        # 0.5*||X_i w - x_i||^2 + 0.5*lambda*||w||_1 is the Lasso objective scaled by n_sample
+        lasso = Lasso(alpha=0.5 * lambda_coef / X.shape[0], fit_intercept=False, tol=1e-8, max_iter=10000)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', ConvergenceWarning)
+            w = lasso.fit(X_i, X[:, i]).coef_
+        r = X[:, i] - np.dot(X_i, w)
+        assert primal[i] <= (0.5 * np.dot(r, r) + 0.5 * lambda_coef * np.abs(w).sum()) * (1 + 1e-8)
+
+
+def test_l1_self_expression_warns_when_not_converged():
+    X = correlated_bands()
+    with pytest.warns(ConvergenceWarning):
+        l1_self_expression(np.dot(X.T, X), 0.1, max_iter=2)
+
+
+def test_l1_self_expression_large_lambda_gives_zero_columns():
+    rng = np.random.RandomState(0)
+    X = rng.rand(100, 8)
+    C, _ = l1_self_expression(np.dot(X.T, X), 1e6)
+    assert np.all(C == 0)
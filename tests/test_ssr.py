@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('cvxpy')
+from classes.SSR import SSC_BS
+
+
+@pytest.mark.filterwarnings('ignore::sklearn.exceptions.ConvergenceWarning')
+def test_fit_predict_l1_with_all_zero_columns():
+    rng = np.random.RandomState(0)
+    X = rng.rand(100, 8)
+    model = SSC_BS(None, 2, lambda_coef=1e6)
+    bands = model.fit_predict_l1(X)
+    assert np.all(model.coef_mat_ == 0)
+    # every band has the same (zero) row of C, so k-means finds a single cluster
+    assert bands.shape == (100, 1)
+    assert not np.any(np.isnan(bands))